@@ -0,0 +1,177 @@
+"""
+Alarm rules on the channels of the DataModel, watched whether a plot shows
+them or not.
+
+    above  a converted value above the limit
+    below  a converted value below the limit
+    rate   |dT/dt| (the derived channel, see derived.py) above the limit, per minute
+    stale  no new rows for `limit` seconds while reading
+
+The AlarmMonitor subscribes to the model for the channels of its rules, so
+they are read and converted even when no plot shows them. A rule only
+looks at the rows the model reports as changed that are newer than the
+last row it saw, compared with the limit as one array, so the cost per
+refresh follows the new rows and not the window. Only the rows where a
+rule goes off or clears again become events, which are kept for the
+alarm window and appended to a rotating log file.
+"""
+import logging
+import logging.handlers
+import time
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+
+
+KINDS = ("above", "below", "rate", "stale")
+LOG_FILE = "alarms.log"
+LOG_SIZE = 1000000
+LOG_BACKUPS = 3
+MAX_EVENTS = 1000  # events kept for the alarm window
+
+
+class AlarmRule():
+    """
+    One limit on one channel. active is whether the alarm
+    is on after the last row (or check) it saw.
+    """
+    def __init__(self, source, column, kind, limit):
+        self.source = source
+        self.column = column
+        self.kind = kind
+        self.limit = limit
+        self.active = False
+        self.last_time = None  # timestamp of the newest row evaluated
+        self.arrival = None    # time.monotonic() of the newest rows, for stale
+
+    def channel(self):
+        if self.kind == "stale":
+            return (self.source, 0)
+        if self.kind == "rate":
+            return (self.source, (self.column, "dT/dt"))
+        return (self.source, self.column)
+
+    def describe(self):
+        if self.kind == "stale":
+            return f"{self.source} stale {self.limit:g} s"
+        unit = " /min" if self.kind == "rate" else ""
+        return f"{self.source} {self.column} {self.kind} {self.limit:g}{unit}"
+
+    def evaluate(self, index, values):
+        # index, values: the changed rows of the channel. Returns
+        # [(timestamp, active, value)] of the rows where the alarm switches.
+        first = 0 if self.last_time is None else np.searchsorted(index, self.last_time, "right")
+        if self.last_time is None and len(index):
+            # a new rule starts from the newest row, not from the history
+            first = len(index) - 1
+        index, values = index[first:], values[first:]
+        if not len(index):
+            return []
+        self.last_time = index[-1]
+        with np.errstate(invalid="ignore"):
+            if self.kind == "above":
+                on = values > self.limit
+            elif self.kind == "below":
+                on = values < self.limit
+            else:
+                on = np.abs(values) > self.limit
+        switches = np.flatnonzero(np.diff(np.concatenate([[self.active], on]).astype(np.int8)))
+        self.active = bool(on[-1])
+        return [(index[i], bool(on[i]), values[i]) for i in switches]
+
+    def check(self, now):
+        # stale rules only, now in time.monotonic()
+        if self.arrival is None:
+            self.arrival = now
+        on = now - self.arrival > self.limit
+        if on == self.active:
+            return []
+        self.active = on
+        return [(np.datetime64(datetime.now()), on, now - self.arrival)]
+
+
+class AlarmMonitor():
+    """
+    This class evaluates the AlarmRules on every update of
+    the DataModel and keeps the events. Stale rules are
+    checked from the Tk main loop while reading, see check.
+    count goes up with every event, so the window can tell
+    whether it has to redraw its indicator.
+    """
+    def __init__(self, model, path=LOG_FILE):
+        self.model = model
+        self.path = path
+        self.rules = []
+        self.events = deque(maxlen=MAX_EVENTS)
+        self.count = 0
+        self.logger = None
+
+    def add(self, rule):
+        self.rules.append(rule)
+        self.subscribe()
+        if rule.source in self.model.sources and rule.kind != "stale":
+            # the current state, without waiting for new rows
+            window = self.model.sources[rule.source][0]
+            self.evaluate(rule, window, (window.start, window.start + len(window)))
+
+    def remove(self, rule):
+        self.rules.remove(rule)
+        self.subscribe()
+
+    def subscribe(self):
+        if self.rules:
+            self.model.subscribe(self.on_change, [rule.channel() for rule in self.rules])
+        else:
+            self.model.unsubscribe(self.on_change)
+
+    def on_change(self, changes):
+        for rule in self.rules:
+            rows = changes.get(rule.channel())
+            if rows is None:
+                continue
+            if rule.kind == "stale":
+                rule.arrival = time.monotonic()
+                self.record(rule, rule.check(rule.arrival))
+            else:
+                self.evaluate(rule, self.model.sources[rule.source][0], rows)
+
+    def evaluate(self, rule, window, rows):
+        col = rule.channel()[1]
+        if col not in window.columns:
+            return
+        first = max(rows[0] - window.start, 0)
+        last = max(rows[1] - window.start, 0)
+        self.record(rule, rule.evaluate(window.index[first:last], window.columns[col][first:last]))
+
+    def check(self):
+        now = time.monotonic()
+        for rule in self.rules:
+            if rule.kind == "stale":
+                self.record(rule, rule.check(now))
+
+    def restart(self):
+        # reading (re)starts, the stale rules count from now
+        for rule in self.rules:
+            rule.arrival = None
+
+    def active(self):
+        return [rule for rule in self.rules if rule.active]
+
+    def record(self, rule, events):
+        for timestamp, on, value in events:
+            when = np.datetime_as_string(timestamp, unit="s").replace("T", " ")
+            text = f"{when} {'ALARM' if on else 'clear'} {rule.describe()} ({value:.4g})"
+            self.events.append(text)
+            self.count += 1
+            self.log(text)
+
+    def log(self, text):
+        if self.logger is None:
+            self.logger = logging.getLogger("plot_temperature_wim.alarms")
+            self.logger.setLevel(logging.INFO)
+            self.logger.propagate = False
+            handler = logging.handlers.RotatingFileHandler(self.path, maxBytes=LOG_SIZE, backupCount=LOG_BACKUPS)
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            self.logger.addHandler(handler)
+        self.logger.info(text)
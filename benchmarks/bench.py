@@ -0,0 +1,321 @@
+"""
+Time the stages of the viewer on synthetic .dat files.
+
+    python benchmarks/bench.py --sizes 1e3,1e4,1e5,1e6 -o results.json
+    python benchmarks/bench.py --sizes 1e3,1e4 --compare results.json
+
+For every size a file is generated with generate_dat.py and the reader,
+every calibration, the reading + conversion done for Mainwindow.read_data
+and Plotframe.plotupdate (on the Agg backend, no window) are timed, as
+well as the imports before the window opens and those deferred to the
+first file (in a new interpreter each, with -X importtime). The
+best of --repeat runs is reported, results are written as json so two
+runs can be compared. 1e7 rows works, but needs about 1 GB of disk.
+"""
+import argparse
+import gzip
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+import matplotlib
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from r_to_t import r_to_t, r_to_t_vec, r_to_t_vec_functions, r_to_t_dict
+from r_to_t_table import r_to_t_table
+from dat_reader import read_n_last_lines
+import segments
+from timeindex import TimeIndex, read_time_range
+from ingest import IngestSource
+from derived import DEFAULTS
+from model import DataModel
+from alarms import AlarmMonitor, AlarmRule
+from plot_temperature_wim import Datasource
+from plotframe import Plotframe, FIGSIZE
+from generate_dat import generate_dat
+
+
+# imported before the window opens, and what the first file adds to that
+STARTUP_IMPORTS = {"startup.window": ["plot_temperature_wim"],
+                   "startup.first_file": ["plot_temperature_wim", "plotframe", "dat_reader", "ingest"]}
+SCALAR_LIMIT = 100000  # the scalar r_to_t functions are too slow for more rows
+APPENDED_ROWS = 100
+
+
+class Value():
+    # stands in for the tkinter variables and widgets read by Plotframe
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def update(self):
+        pass
+
+
+class HeadlessPlotframe(Plotframe):
+    """
+    Plotframe without tkinter: the figure is drawn on an
+    Agg canvas and the controls are plain values, so the
+    real plotupdate can be timed without a display.
+    """
+    def __init__(self, sources, visible, model):
+        self.model = model
+        self.fig = Figure(figsize=FIGSIZE, tight_layout=True)
+        self.ax = self.fig.add_subplot(111)
+        self.construct_lines(sources)
+        self.ax.grid()
+        self.background = None
+        self.xent = None
+        self.ychoice = "value"
+        self.data_dict = {}
+        self.ax.callbacks.connect("xlim_changed", self.decimate_lines)
+        self.canvas = FigureCanvasAgg(self.fig)
+        self.canvas.mpl_connect("draw_event", self.on_draw)
+        self.canvas.draw()
+        self.navtoolbar = Value(None)
+        self.lockxvar = Value(True)
+        self.lockyvar = Value(True)
+        max_columns = max(source.max_columns for source in sources.values())
+        xdata_keys = [f"column {i}" for i in range(max_columns + 1)]
+        xdata_keys[0] = "real time"
+        xdata_keys[1] = "time [s]"
+        self.xdata_dict = dict(zip(xdata_keys, range(max_columns + 1)))
+        self.xdatacbb = Value("real time")
+        self.ydatacbb = Value("value")
+        self.ydatadict = {key: Value(key in visible) for key in self.line_dict}
+
+
+def best_time(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def import_time(modules):
+    # seconds to import the modules in a fresh interpreter, from -X importtime
+    code = "; ".join(f"import {module}" for module in modules)
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), check=True)
+    total = 0
+    for line in process.stderr.splitlines():
+        # import time: self [us] | cumulative | module, nested modules are indented
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() in modules and fields[2][1:2] != " ":
+            total += int(fields[1])
+    return total*1e-6
+
+
+def bench_startup(repeat):
+    results = []
+    for name, modules in STARTUP_IMPORTS.items():
+        seconds = min(import_time(modules) for _ in range(repeat))
+        results.append({"name": name, "rows": 0, "seconds": seconds, "repeat": repeat})
+        print(f"{0:>10} {name:<32} {seconds*1e3:10.2f} ms", file=sys.stderr)
+    return results
+
+
+def bench_size(path, rows, channels, repeat):
+    results = []
+
+    def record(name, func, repeat=repeat):
+        seconds = best_time(func, repeat)
+        results.append({"name": name, "rows": rows, "seconds": seconds, "repeat": repeat})
+        print(f"{rows:>10} {name:<32} {seconds*1e3:10.2f} ms", file=sys.stderr)
+
+    record("read_n_last_lines.tail200", lambda: read_n_last_lines(path, 200))
+    record("read_n_last_lines.all", lambda: read_n_last_lines(path, rows), max(1, repeat//2))
+
+    # as many rows as tail200 from the middle of the file, through the time index
+    first = pd.Timestamp(segments.first_timestamp(path).decode())
+    last = read_n_last_lines(path, 1).index[-1]
+    start = first + (last - first)/2
+    stop = start + (last - first)*200/rows
+    index_path = TimeIndex(path).paths[0]
+
+    def build_index():
+        if os.path.exists(index_path):
+            os.remove(index_path)
+        TimeIndex(path).update()
+
+    record("timeindex.build", build_index, max(1, repeat//2))
+    record("read_time_range.200rows", lambda: read_time_range(path, start, stop))
+    os.remove(index_path)
+
+    # the same file gzipped: the seek index is built by the first read, later tails use it
+    compressed = path + ".gz"
+    with open(path, 'rb') as f, gzip.open(compressed, 'wb', compresslevel=6) as g:
+        shutil.copyfileobj(f, g)
+
+    def index_gz():
+        segments.segments.clear()
+        segments.compressed_segment(compressed).length()
+
+    record("read_n_last_lines.index_gz", index_gz, max(1, repeat//2))
+    record("read_n_last_lines.tail200gz", lambda: read_n_last_lines(compressed, 200))
+    os.remove(compressed)
+
+    r = np.asarray(read_n_last_lines(path, rows)[2])
+    names = {conv: name for name, conv in r_to_t_dict.items()}
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        for conv in r_to_t_vec_functions:
+            label = names.get(conv, str(conv))
+            record(f"r_to_t_vec.{label}", lambda: r_to_t_vec(conv)(r))
+            r_to_t_table(conv)  # built once, outside the timing
+            record(f"r_to_t_table.{label}", lambda: r_to_t_table(conv)(r))
+            if rows <= SCALAR_LIMIT:
+                func = r_to_t(conv)
+                record(f"r_to_t.{label}", lambda: [func(x) for x in r], 1)
+
+    # what Mainwindow.read_data asks the ingestion worker to do, without the thread
+    calibrations = {col: r_to_t_dict["N" if col % 2 else "RF100"] for col in range(2, channels + 2)}
+    worker = IngestSource(path, rows)
+
+    def read_data():
+        worker.reset()
+        worker.reader.read()
+        return worker.convert(calibrations)
+
+    record("read_data.load", read_data, max(1, repeat//2))
+
+    def read_two_columns():
+        # only the two thermometers that are shown
+        worker.reset()
+        worker.reader.set_columns([2, 3])
+        worker.reader.read()
+        return worker.convert(calibrations)
+
+    record("read_data.load2columns", read_two_columns, max(1, repeat//2))
+    worker.reader.set_columns(None)
+    window, pyramids = read_data()
+
+    copy = path + ".poll"
+    shutil.copy(path, copy)
+    worker = IngestSource(copy, rows)
+    worker.reader.read()
+    worker.convert(calibrations)
+    lines = "".join(open(path).readlines()[-APPENDED_ROWS:])
+
+    def poll():
+        with open(copy, 'a') as f:
+            f.write(lines)
+        worker.reader.read()
+        worker.convert(calibrations)
+
+    record(f"read_data.poll{APPENDED_ROWS}", poll)
+
+    # the same with every derived channel of two thermometers
+    worker.convert(calibrations, [2, 3], DEFAULTS)
+
+    def poll_derived():
+        with open(copy, 'a') as f:
+            f.write(lines)
+        worker.reader.read()
+        worker.convert(calibrations, [2, 3], DEFAULTS)
+
+    record(f"read_data.poll{APPENDED_ROWS}derived", poll_derived)
+
+    # above and below on every thermometer, rate on the two with derived channels
+    monitor = AlarmMonitor(DataModel(), os.devnull)
+    for col in range(2, channels + 2):
+        monitor.rules += [AlarmRule("bench", col, "above", 1e3), AlarmRule("bench", col, "below", 1.0)]
+    monitor.rules += [AlarmRule("bench", col, "rate", 1.0) for col in (2, 3)]
+    polled = worker.convert(calibrations, [2, 3], DEFAULTS)
+    monitor.model.update({"bench": polled})
+    stop = polled[0].start + len(polled[0])
+    changes = {rule.channel(): (stop - APPENDED_ROWS, stop) for rule in monitor.rules}
+
+    def evaluate_alarms():
+        # the appended rows repeat earlier timestamps, so every rule is set back before them
+        for rule in monitor.rules:
+            rule.last_time = polled[0].index[-APPENDED_ROWS - 1]
+        monitor.on_change(changes)
+
+    record(f"alarms.poll{APPENDED_ROWS}", evaluate_alarms)
+    os.remove(copy)
+
+    sources = {"bench": Datasource("bench", path, channels + 1)}
+    model = DataModel()
+    model.update({"bench": (window, pyramids)})
+    frame = HeadlessPlotframe(sources, visible={("bench", 2), ("bench", 3)}, model=model)
+
+    def plotupdate_full():
+        frame.background = None
+        frame.plotupdate()
+
+    record("plotupdate.full", plotupdate_full)
+    record("plotupdate.blit", frame.plotupdate)
+    return results
+
+
+def compare(results, path):
+    with open(path) as f:
+        old = {(r["name"], r["rows"]): r["seconds"] for r in json.load(f)["results"]}
+    print(f"{'rows':>10} {'name':<32} {'old ms':>10} {'new ms':>10} {'ratio':>7}")
+    for r in results:
+        key = (r["name"], r["rows"])
+        if key in old:
+            print(f"{r['rows']:>10} {r['name']:<32} {old[key]*1e3:10.2f} {r['seconds']*1e3:10.2f} "
+                  f"{r['seconds']/old[key]:7.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark reading, conversion and plotting.")
+    parser.add_argument("--sizes", default="1e3,1e4,1e5,1e6", help="comma separated numbers of rows")
+    parser.add_argument("--channels", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--workdir", default=None, help="keep the generated files here")
+    parser.add_argument("-o", "--output", default=None, help="json file, default stdout")
+    parser.add_argument("--compare", default=None, help="json file of an earlier run")
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_dat_")
+    os.makedirs(workdir, exist_ok=True)
+    results = bench_startup(args.repeat)
+    try:
+        for size in args.sizes.split(","):
+            rows = int(float(size))
+            path = os.path.join(workdir, f"bench_{rows}.dat")
+            if not os.path.exists(path):
+                generate_dat(path, rows, args.channels)
+            results += bench_size(path, rows, args.channels, args.repeat)
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir)
+
+    output = {"meta": {"time": time.strftime("%Y-%m-%d %H:%M:%S"),
+                       "python": platform.python_version(),
+                       "platform": platform.platform(),
+                       "numpy": np.__version__,
+                       "pandas": pd.__version__,
+                       "matplotlib": matplotlib.__version__,
+                       "channels": args.channels},
+              "results": results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=1)
+    else:
+        json.dump(output, sys.stdout, indent=1)
+        print()
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
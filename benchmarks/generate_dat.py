@@ -0,0 +1,58 @@
+"""
+Write synthetic .dat files that look like the ones of the logger.
+
+    python benchmarks/generate_dat.py fake.dat --rows 1000000 --channels 8
+
+Every channel follows a cooldown: its resistance rises from 50 Ohm to
+20 kOhm over the file (with noise), so the conversions pass through both
+branches of every piecewise calibration.
+"""
+import argparse
+import datetime
+
+import numpy as np
+import pandas as pd
+
+
+R_START = 50
+R_END = 20000
+
+
+def generate_dat(path, rows, channels=8, comment_every=1000, interval=5.0, seed=0,
+                 start=datetime.datetime(2024, 1, 1)):
+    rng = np.random.default_rng(seed)
+    block = comment_every if comment_every else 100000
+    with open(path, 'w') as f:
+        f.write(f"# synthetic data, {rows} rows, {channels} channels\n")
+        for first in range(0, rows, block):
+            n = min(block, rows - first)
+            row = np.arange(first, first + n)
+            seconds = row*interval
+            timestamps = np.datetime64(start, "us") + (seconds*1e6).astype("timedelta64[us]")
+            columns = {1: seconds}
+            for channel in range(channels):
+                # every channel cools down with its own delay
+                progress = np.clip(row/max(rows - 1, 1) * (1 + 0.1*channel) - 0.05*channel, 0, 1)
+                r = R_START*(R_END/R_START)**progress
+                columns[channel + 2] = r*(1 + 1e-3*rng.standard_normal(n))
+            index = np.char.replace(np.datetime_as_string(timestamps, unit="us"), "T", " ")
+            pd.DataFrame(columns, index=index).to_csv(f, sep="\t", header=False, float_format="%.6g",
+                                                       lineterminator="\n")
+            if comment_every and first + n < rows:
+                f.write(f"# comment after row {first + n}\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic thermometer .dat file.")
+    parser.add_argument("path")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--channels", type=int, default=8)
+    parser.add_argument("--comment-every", type=int, default=1000, help="rows between comment lines, 0 for none")
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between rows")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    generate_dat(args.path, args.rows, args.channels, args.comment_every, args.interval, args.seed)
+
+
+if __name__ == "__main__":
+    main()
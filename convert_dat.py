@@ -0,0 +1,106 @@
+"""
+Convert .dat files to temperatures without the gui.
+
+    python convert_dat.py run1.dat run2.dat -c 2=N -c 3=RF100 -f csv -j 4
+
+Every file is read in chunks of --rows lines, so memory use does not
+depend on the file size, and several files are converted in parallel.
+Columns without a calibration are written unchanged. The csv output has
+the timestamp as first column, the binary output (.bin) is a row-major
+array of records (timestamp as datetime64[ns], then float64 columns)
+described by a .json file next to it, it can be opened with
+np.memmap(path, dtype=np.dtype(descr), mode="r"). With --table the
+calibrations are evaluated through the interpolation tables of
+r_to_t_table.py (relative error below 1e-8) instead of the closed form.
+"""
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from r_to_t import r_to_t_vec, r_to_t_dict
+from r_to_t_table import r_to_t_table
+from dat_reader import read_chunks
+from segments import base_name
+
+
+CHUNK_ROWS = 100000
+
+
+def parse_channels(items):
+    calibrations = {}
+    for item in items:
+        column, _, name = item.partition("=")
+        if not column.strip().isdigit():
+            raise argparse.ArgumentTypeError(f"column {column!r} of {item!r} is not a column number, use e.g. 2=N")
+        if name not in r_to_t_dict:
+            raise argparse.ArgumentTypeError(f"unknown calibration {name!r}, choose from {', '.join(r_to_t_dict)}")
+        calibrations[int(column)] = r_to_t_dict[name]
+    return calibrations
+
+
+def output_path(path_to_file, output_dir, fmt):
+    stem = base_name(path_to_file)
+    return os.path.join(output_dir or os.path.dirname(path_to_file), f"{stem}_T.{fmt}")
+
+
+def convert_chunk(df, calibrations, engine=r_to_t_vec):
+    for col, conv in calibrations.items():
+        if col in df.columns:
+            df[col] = engine(conv)(df[col].to_numpy())
+    return df
+
+
+def convert_file(path_to_file, calibrations, fmt="csv", output_dir=None, rows=CHUNK_ROWS, table=False):
+    engine = r_to_t_table if table else r_to_t_vec
+    path = output_path(path_to_file, output_dir, fmt)
+    total = 0
+    descr = None
+    with open(path, 'w' if fmt == "csv" else 'wb') as f:
+        for df in read_chunks(path_to_file, rows):
+            df = convert_chunk(df, calibrations, engine)
+            if fmt == "csv":
+                df.to_csv(f, header=total == 0, index_label="time", lineterminator="\n")
+            else:
+                records = np.empty(len(df), dtype=[("time", "<M8[ns]")] + [(str(col), "<f8") for col in df.columns])
+                records["time"] = df.index.as_unit("ns").to_numpy()
+                for col in df.columns:
+                    records[str(col)] = df[col].to_numpy(dtype=float)
+                f.write(records.tobytes())
+                descr = records.dtype.descr
+            total += len(df)
+    if fmt == "bin":
+        with open(os.path.splitext(path)[0] + ".json", 'w') as f:
+            json.dump({"source": os.path.abspath(path_to_file), "rows": total, "descr": descr,
+                       "calibrations": {str(col): conv for col, conv in calibrations.items()}}, f, indent=1)
+    return path, total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert thermometer .dat files to temperatures.")
+    parser.add_argument("files", nargs="+", help=".dat files to convert")
+    parser.add_argument("-c", "--channel", action="append", default=[], metavar="COLUMN=CALIBRATION",
+                        help=f"calibration of a column, one of: {', '.join(r_to_t_dict)}")
+    parser.add_argument("-f", "--format", choices=["csv", "bin"], default="csv")
+    parser.add_argument("-o", "--output-dir", default=None, help="default: next to the .dat file")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="files converted in parallel")
+    parser.add_argument("--rows", type=int, default=CHUNK_ROWS, help="lines per chunk")
+    parser.add_argument("--table", action="store_true", help="convert through interpolation tables")
+    args = parser.parse_args(argv)
+    try:
+        calibrations = parse_channels(args.channel)
+    except argparse.ArgumentTypeError as error:
+        parser.error(str(error))
+
+    with ProcessPoolExecutor(max_workers=max(1, min(args.jobs, len(args.files)))) as pool:
+        futures = [pool.submit(convert_file, path, calibrations, args.format, args.output_dir, args.rows, args.table)
+                   for path in args.files]
+        for path_to_file, future in zip(args.files, futures):
+            path, total = future.result()
+            print(f"{path_to_file} -> {path} ({total} rows)")
+
+
+if __name__ == "__main__":
+    main()
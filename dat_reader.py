@@ -0,0 +1,345 @@
+import io
+import os
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+
+from ringbuffer import RingBuffer
+from segments import open_dat, stat_dat
+from timing import timer
+
+
+BLOCK_SIZE = 1 << 16
+
+# str(datetime.now()) as written by the logger, e.g. 2024-01-01 12:00:00.123456
+TIMESTAMP_LAYOUT = "0000-00-00 00:00:00.000000"
+TIMESTAMP_CHARS = np.array([ord(c) for c in TIMESTAMP_LAYOUT])
+TIMESTAMP_DIGITS = TIMESTAMP_CHARS == ord("0")
+TIMESTAMP_FIELDS = {"year": (0, 4), "month": (4, 6), "day": (6, 8), "hour": (8, 10),
+                    "minute": (10, 12), "second": (12, 14), "microsecond": (14, 20)}
+DAYS_IN_MONTH = np.array([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+
+
+def decode_timestamps(values):
+    # Vectorized decoder for the fixed layout, works on the character codes
+    # of a str or bytes array. Returns None when any timestamp does not
+    # follow the layout exactly.
+    values = np.asarray(values)
+    if values.ndim != 1 or values.dtype.kind not in "SU":
+        return None
+    code = np.uint8 if values.dtype.kind == "S" else np.uint32
+    if values.dtype.itemsize != len(TIMESTAMP_LAYOUT)*np.dtype(code).itemsize:
+        return None
+    chars = values.view(code).reshape(-1, len(TIMESTAMP_LAYOUT))
+    if code is np.uint32:
+        if (chars > 127).any():
+            return None
+        chars = chars.astype(np.uint8)
+    # one row per character position, so every field is a contiguous row
+    chars = np.ascontiguousarray(chars.T)
+    for position in np.flatnonzero(~TIMESTAMP_DIGITS):
+        if (chars[position] != TIMESTAMP_CHARS[position]).any():
+            return None
+    digits = chars[TIMESTAMP_DIGITS] - np.uint8(ord("0"))
+    if (digits > 9).any():
+        # characters below "0" wrapped around
+        return None
+    fields = {}
+    for name, (first, last) in TIMESTAMP_FIELDS.items():
+        fields[name] = digits[first].astype(np.int32)
+        for i in range(first + 1, last):
+            fields[name] = 10*fields[name] + digits[i]
+    if (fields["month"] < 1).any() or (fields["month"] > 12).any():
+        return None
+    year = fields["year"]
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    month_length = DAYS_IN_MONTH[fields["month"]] + (leap & (fields["month"] == 2))
+    if ((fields["day"] < 1).any() or (fields["day"] > month_length).any() or (fields["hour"] > 23).any()
+            or (fields["minute"] > 59).any() or (fields["second"] > 59).any()):
+        return None
+    seconds = (days_since_epoch(fields["year"], fields["month"], fields["day"]).astype(np.int64)*86400
+               + fields["hour"]*3600 + fields["minute"]*60 + fields["second"])
+    return ((seconds*1000000 + fields["microsecond"])*1000).view("datetime64[ns]")
+
+
+def days_since_epoch(year, month, day):
+    # days from 1970-01-01 for the proleptic Gregorian calendar (H. Hinnant's days_from_civil)
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era*400
+    day_of_year = (153*np.where(month > 2, month - 3, month + 9) + 2)//5 + day - 1
+    day_of_era = year_of_era*365 + year_of_era//4 - year_of_era//100 + day_of_year
+    return era*146097 + day_of_era - 719468
+
+
+def parse_timestamps(strings):
+    timestamps = decode_timestamps(strings)
+    if timestamps is not None:
+        return pd.DatetimeIndex(timestamps)
+    try:
+        return pd.to_datetime(strings, format="ISO8601")
+    except ValueError:
+        return pd.to_datetime(strings)
+
+
+def lines_to_dataframe(lines, columns=None):
+    with timer.stage("parse"):
+        return parse_lines(lines, columns)
+
+
+def parse_lines(lines, columns=None):
+    # Turn raw .dat lines into a dataframe indexed by timestamp,
+    # comment lines (starting with "#") are skipped. With columns
+    # only those columns are kept, lines are not split further
+    # than the last of them and the others are never converted.
+    maxsplit = -1 if columns is None else max(columns, default=1) + 1
+    splitted_lines = [s.split("\t", maxsplit) for s in list(filter(None, '\n'.join(lines).splitlines()))]
+    splitted_lines = [s for s in splitted_lines if "#" not in s[0]]
+    df = pd.DataFrame(splitted_lines)
+    if df.empty:
+        return df
+    df = df.set_index(list(df)[0])
+    if columns is not None:
+        df = df[[col for col in df.columns if col in columns]]
+    df.index = parse_timestamps(df.index.to_numpy(dtype=str))
+    df = df.apply(pd.to_numeric)
+    return df
+
+
+def is_data_line(line):
+    return line.strip() != b"" and b"#" not in line.split(b"\t", 1)[0]
+
+
+def read_tail_lines(f, n, block_size=BLOCK_SIZE):
+    # Walk backwards through a binary file in blocks until n complete
+    # data lines are found. Returns these lines (oldest first) and the
+    # offset just after the last complete line, an unfinished last line
+    # is left for the next read.
+    f.seek(0, os.SEEK_END)
+    size = pos = f.tell()
+    end = None
+    carry = b""
+    lines = []
+    while pos > 0 and (end is None or len(lines) < n):
+        step = min(block_size, pos)
+        pos -= step
+        f.seek(pos)
+        pieces = (f.read(step) + carry).split(b"\n")
+        carry = pieces.pop(0)
+        if end is None:
+            if not pieces:
+                continue
+            end = size - len(pieces.pop())
+        for piece in reversed(pieces):
+            if len(lines) >= n:
+                break
+            if is_data_line(piece):
+                lines.append(piece)
+    if pos == 0 and end is not None and len(lines) < n and is_data_line(carry):
+        lines.append(carry)
+    lines.reverse()
+    return lines, end or 0
+
+
+def read_n_last_lines(path_to_file, n):
+    with open_dat(path_to_file) as f:
+        lines, _ = read_tail_lines(f, n)
+    return lines_to_dataframe([line.decode() for line in lines])
+
+
+def read_chunks(path_to_file, rows):
+    # yields the file as dataframes of at most `rows` lines each
+    with io.TextIOWrapper(open_dat(path_to_file)) as f:
+        while True:
+            lines = list(islice(f, rows))
+            if not lines:
+                break
+            df = lines_to_dataframe(lines)
+            if not df.empty:
+                yield df
+
+
+def select_span(df, start, stop=None):
+    # the rows of a parsed dataframe from start to stop (both included)
+    if not len(df):
+        return df
+    index = df.index.to_numpy()
+    keep = index >= np.datetime64(start, "ns")
+    if stop is not None:
+        keep &= index <= np.datetime64(stop, "ns")
+    return df if keep.all() else df[keep]
+
+
+def frame_columns(df):
+    # the arrays of a parsed dataframe, keyed like the columns of a RingBuffer
+    columns = {"index": df.index.to_numpy()}
+    for col in df.columns:
+        columns[col] = df[col].to_numpy(dtype=float)
+    return columns
+
+
+class TailReader():
+    """
+    This class keeps the last n rows of a .dat file
+    in memory and remembers up to which byte the file
+    has been read. Every call to read only parses the
+    lines that were appended since the previous call
+    and writes them into a RingBuffer of n rows, so
+    memory stays the same however long the file is read.
+    When the file is replaced (other inode) or truncated
+    the window is read again from scratch. Rows are counted
+    per generation (one generation per full read), so the
+    window always holds rows rows_read-len(window) to
+    rows_read. With a SidecarCache the window is loaded
+    from the binary cache and the cache is extended with
+    every appended line, n=None then means the whole file,
+    served as memory mapped arrays of the cache. Only the
+    columns in required (None for all) are parsed and kept,
+    asking for another column reads the window again.
+    path_to_file can also be a compressed file or a tuple
+    of segments, see segments.py. n can also be a time
+    range (start, stop) of datetime64 (stop None: up to the
+    newest row), those rows are found with the TimeIndex
+    (or the timestamps of the SidecarCache) and only they
+    are parsed, new rows are kept when they are in range.
+    """
+    def __init__(self, path_to_file, n, sidecar=None, required=None, time_index=None):
+        self.path_to_file = path_to_file
+        self.n = n
+        self.sidecar = sidecar
+        self.time_index = time_index
+        self.required = required
+        self.buffer = None
+        self.columns = None
+        self.loaded = False
+        self.offset = 0
+        self.inode = None
+        self.new_rows = 0
+        self.generation = 0
+        self.rows_read = 0
+
+    def set_length(self, n):
+        if n != self.n:
+            self.n = n
+            self.loaded = False
+
+    def span(self):
+        # (start, stop) of a time range window, else None
+        return self.n if isinstance(self.n, tuple) else None
+
+    def capacity(self):
+        # rows kept in memory, None for all rows that were read
+        return None if self.n is None or self.span() is not None else self.n
+
+    def set_columns(self, required):
+        # dropping columns keeps the window, a new column is only read with the whole window
+        if required == self.required:
+            return
+        self.required = required
+        if not self.loaded:
+            return
+        if required is None or not set(required).issubset(self.columns):
+            self.loaded = False
+            return
+        if self.buffer is not None:
+            for col in set(self.columns).difference(required):
+                self.buffer.drop(col)
+        self.columns = [col for col in self.columns if col in required]
+
+    def reset(self):
+        self.loaded = False
+
+    def read(self):
+        stat = stat_dat(self.path_to_file)
+        if not self.loaded or stat.st_ino != self.inode or stat.st_size < self.offset:
+            self.reload(stat)
+        else:
+            self.read_appended(stat)
+
+    def window(self):
+        # timestamps and columns of the rows in memory, views without copies
+        if self.buffer is None:
+            arrays = self.sidecar.open()
+            index = arrays.pop("index", np.empty(0, "datetime64[ns]"))
+            return index, {int(name): array for name, array in arrays.items() if int(name) in self.columns}
+        return self.buffer.view("index"), {col: self.buffer.view(col) for col in self.columns}
+
+    def reload(self, stat):
+        span = self.span()
+        if self.sidecar is not None:
+            self.sidecar.update()
+            rows = self.sidecar.rows
+            if span is not None:
+                start, rows = self.sidecar.between(*span)
+            else:
+                start = 0 if self.n is None else max(rows - self.n, 0)
+            with timer.stage("io"):
+                df = self.sidecar.dataframe(start, rows, self.required)
+            self.offset = self.sidecar.offset
+            self.rows_read = rows
+        else:
+            if span is not None and self.time_index is not None:
+                self.time_index.update()
+            with timer.stage("io"), open_dat(self.path_to_file) as f:
+                if span is None:
+                    lines, self.offset = read_tail_lines(f, self.n)
+                elif self.time_index is not None:
+                    lines = self.time_index.lines(f, *span)
+                    _, self.offset = read_tail_lines(f, 0)
+                else:
+                    lines, self.offset = read_tail_lines(f, float("inf"))
+            df = lines_to_dataframe([line.decode() for line in lines], self.required)
+            if span is not None:
+                df = select_span(df, *span)
+            self.rows_read = len(df)
+        self.columns = list(df.columns)
+        if self.sidecar is not None and self.n is None:
+            # the whole history stays in the memory mapped cache
+            self.buffer = None
+        else:
+            dtypes = {"index": "datetime64[ns]", **{col: float for col in self.columns}}
+            self.buffer = RingBuffer(self.capacity(), dtypes, len(df))
+            self.buffer.append(frame_columns(df))
+        self.inode = stat.st_ino
+        self.new_rows = len(df)
+        self.loaded = True
+        self.generation += 1
+
+    def read_appended(self, stat):
+        self.new_rows = 0
+        if stat.st_size == self.offset:
+            return
+        with timer.stage("io"), open_dat(self.path_to_file) as f:
+            f.seek(self.offset)
+            chunk = f.read(stat.st_size - self.offset)
+        end = chunk.rfind(b"\n") + 1
+        if end == 0:
+            return
+        lines = chunk[:end].decode().splitlines()
+        if self.sidecar is not None:
+            # the cache keeps every column
+            new_df = lines_to_dataframe(lines)
+            if not self.sidecar.append(new_df, self.offset, self.offset + end):
+                # the cache was out of step with this reader
+                self.reload(stat)
+                return
+            if self.required is not None and not new_df.empty:
+                new_df = new_df[[col for col in new_df.columns if col in self.required]]
+        else:
+            new_df = lines_to_dataframe(lines, self.required)
+        if self.span() is not None:
+            new_df = select_span(new_df, *self.span())
+        if len(new_df) and self.rows_read and list(new_df.columns) != self.columns:
+            raise ValueError(f"{self.path_to_file} changed its number of columns")
+        self.offset += end
+        if not len(new_df):
+            return
+        if not self.rows_read:
+            # the file was empty until now
+            self.reload(stat)
+            return
+        self.rows_read += len(new_df)
+        self.new_rows = len(new_df) if self.capacity() is None else min(len(new_df), self.capacity())
+        if self.buffer is not None:
+            self.buffer.append(frame_columns(new_df))
@@ -0,0 +1,26 @@
+import numpy as np
+
+
+def minmax_indices(x, y, xmin, xmax, buckets):
+    # Indices of the points worth drawing when the range xmin..xmax is
+    # only `buckets` pixels wide: per pixel the first points with the
+    # lowest and the highest y value, so spikes stay visible, and the
+    # points next to them, so the line into and out of a spike follows
+    # the data instead of cutting across it. One point on either side of
+    # the range is kept so the line runs to the edge. x has to be sorted.
+    start = max(np.searchsorted(x, xmin, "left") - 1, 0)
+    stop = min(np.searchsorted(x, xmax, "right") + 1, len(x))
+    if stop - start <= 6*buckets:
+        return np.arange(start, stop)
+    edges = np.searchsorted(x, np.linspace(xmin, xmax, buckets + 1)[1:-1])
+    starts = np.unique(np.concatenate([[start], np.clip(edges, start, stop - 1)])) - start
+    segment = y[start:stop]
+    counts = np.diff(np.append(starts, len(segment)))
+    bucket = np.repeat(np.arange(len(starts)), counts)
+    indices = [[0, len(segment) - 1]]
+    for reduce in (np.fmin, np.fmax):
+        extreme = np.repeat(reduce.reduceat(segment, starts), counts)
+        hits = np.flatnonzero(segment == extreme)
+        _, first = np.unique(bucket[hits], return_index=True)
+        indices += [hits[first] - 1, hits[first], hits[first] + 1]
+    return np.unique(np.clip(np.concatenate(indices), 0, len(segment) - 1)) + start
@@ -0,0 +1,173 @@
+"""
+Channels derived from a converted thermometer column, computed while the
+data streams in.
+
+    (col, "mean")    rolling mean over the last `average` minutes
+    (col, "std")     rolling standard deviation over the same rows
+    (col, "dT/dt")   slope of the rolling mean over one averaging window, per minute
+    (col, "stable")  1 when every value of the last `minutes` minutes lies within
+                     `percent` % of the rolling mean, else 0
+
+Cumulative count, sum and sum of squares are kept per column next to the
+values, the sums over any window are then a difference of two of them.
+They are shifted by a value near the window and start again at the
+current window every two window lengths, so they stay as small as the
+spread of the values and keep their precision when the temperature drifts
+over decades. Values beyond LIMIT are left out like nan, so one of them
+does not overflow the sums for every later window. New
+rows cost a constant amount of work each (amortized), whatever the window
+length; everything is computed again only when the window is read again,
+the calibration or the settings change.
+"""
+import numpy as np
+
+
+KINDS = ("mean", "std", "dT/dt", "stable")
+STATE = ("count", "sum", "sumsq")
+DEFAULTS = (10.0, 1.0, 30.0)  # average [min], stable [%], stable [min]
+MINUTES_PER_DAY = 24*60       # x are matplotlib date numbers (days)
+CHUNK = 1024                  # rows computed at once, at least
+LIMIT = 1e100                 # larger values (out of range of a calibration) are left out
+
+
+def valid_values(z):
+    # not nan and small enough that no sum of squares can overflow
+    with np.errstate(invalid="ignore"):
+        return np.abs(z) <= LIMIT
+
+
+def derived_column(col):
+    # the thermometer column a (col, kind) channel is derived from
+    return col[0] if isinstance(col, tuple) else col
+
+
+class DerivedChannels():
+    """
+    This class adds the derived channels of the wanted
+    columns to the RingBuffer of converted values of an
+    IngestSource and keeps them up to date. The only state
+    outside the buffer is the shift and the row the sums
+    start at per column, and the time of the last value
+    outside the stable band.
+    """
+    def __init__(self):
+        self.settings = None
+        self.columns = []
+        self.shift = {}
+        self.base = {}
+        self.unstable = {}
+
+    def reset(self):
+        self.columns = []
+
+    def update(self, store, wanted, settings, new, redo):
+        # wanted: columns with derived channels, redo: columns whose values
+        # all changed, new: rows appended to store. Returns {col: first row}
+        # of the rows that changed per column, in store positions.
+        for col in self.columns:
+            if col not in wanted:
+                for kind in STATE + KINDS:
+                    store.drop((col, kind))
+        if settings != self.settings:
+            self.settings = settings
+            self.columns = []
+        changed = {}
+        for col in wanted:
+            if col in redo or col not in self.columns or new >= len(store):
+                changed[col] = 0
+            elif new:
+                changed[col] = len(store) - new
+            else:
+                continue
+            self.compute(store, col, changed[col])
+        self.columns = list(wanted)
+        return changed
+
+    def compute(self, store, col, first):
+        x = store.view("xnum")
+        y = store.view(col)
+        if not len(y):
+            return
+        # store positions are rows since the start minus offset
+        offset = store.total - len(y)
+        if first == 0:
+            # new arrays, views handed out before keep their values
+            for kind in STATE + KINDS:
+                store.replace((col, kind), np.full(len(y), np.nan))
+            self.rebase(store, col, 0, 0)
+            self.unstable[col] = x[0]
+        average = self.settings[0]/MINUTES_PER_DAY
+        while first < len(y):
+            # the window of row `first` starts after row j
+            j = np.searchsorted(x, x[first] - average, "right") - 1
+            window = max(first - max(j, 0), CHUNK)
+            if first - (self.base[col] - offset) > 2*window:
+                # two windows since the last rebase, the sums start again
+                # at the window, close to the values they have now
+                self.rebase(store, col, max(j, 0), first)
+            stop = min(len(y), first + window)
+            self.compute_rows(store, col, first, stop)
+            first = stop
+
+    def rebase(self, store, col, row, first):
+        # cumulative sums from row on, shifted by the first value there, so
+        # they stay as small as the spread of two windows of values. Rows
+        # before row are not used any more.
+        y = store.view(col)
+        usable = np.flatnonzero(valid_values(y[row:]))
+        if len(usable):
+            self.shift[col] = y[row + usable[0]]
+        else:
+            self.shift[col] = self.shift.get(col, 0.0)
+        self.base[col] = store.total - len(y) + row
+        self.cumulate(store, col, row, first, (0, 0, 0))
+
+    def cumulate(self, store, col, first, stop, before):
+        y = store.view(col)[first:stop]
+        z = y - self.shift[col]
+        valid = valid_values(z)
+        z = np.where(valid, z, 0)
+        for kind, values, start in zip(STATE, (valid, z, z*z), before):
+            store.view((col, kind))[first:stop] = start + np.cumsum(values)
+
+    def compute_rows(self, store, col, first, stop):
+        average, percent, minutes = self.settings
+        x = store.view("xnum")
+        y = store.view(col)
+        count, total, squares = (store.view((col, kind)) for kind in STATE)
+        shift = self.shift[col]
+        before = (count[first-1], total[first-1], squares[first-1]) if first else (0, 0, 0)
+        self.cumulate(store, col, first, stop, before)
+
+        # the rows after j up to p are within one averaging window of row p
+        p = np.arange(first, stop)
+        j = np.searchsorted(x, x[first:stop] - average/MINUTES_PER_DAY, "right") - 1
+        # before the first row of the store the sums are its row taken off,
+        # only used when the sums did not start again after it
+        v0 = valid_values(y[0] - shift)
+        z0 = y[0] - shift if v0 else 0
+        start = (count[0] - v0, total[0] - z0, squares[0] - z0*z0)
+        inside = j >= 0
+        jc = np.maximum(j, 0)
+        m = count[p] - np.where(inside, count[jc], start[0])
+        s = total[p] - np.where(inside, total[jc], start[1])
+        q = squares[p] - np.where(inside, squares[jc], start[2])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = np.where(m > 0, s/m + shift, np.nan)
+            variance = np.where(m > 1, (q - s*s/m)/(m - 1), np.nan)
+        store.view((col, "mean"))[first:stop] = mean
+        store.view((col, "std"))[first:stop] = np.sqrt(np.maximum(variance, 0))
+
+        means = store.view((col, "mean"))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            slope = (means[p] - means[jc])/((x[p] - x[jc])*MINUTES_PER_DAY)
+        store.view((col, "dT/dt"))[first:stop] = np.where(jc < p, slope, np.nan)
+
+        # stable once no value left the band for `minutes`
+        with np.errstate(invalid="ignore"):
+            outside = ~(np.abs(y[first:stop] - mean) <= percent/100*np.abs(mean))
+        last_outside = np.maximum.accumulate(np.where(outside, x[first:stop], -np.inf))
+        last_outside = np.maximum(last_outside, self.unstable[col])
+        self.unstable[col] = last_outside[-1]
+        stable = (x[first:stop] - last_outside)*MINUTES_PER_DAY >= minutes
+        store.view((col, "stable"))[first:stop] = stable
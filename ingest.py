@@ -0,0 +1,256 @@
+import cProfile
+import os
+import queue
+import threading
+
+import matplotlib.dates as mdates
+
+from dat_reader import TailReader
+from derived import DerivedChannels, derived_column, DEFAULTS, KINDS
+from r_to_t import r_to_t_vec
+from ringbuffer import RingBuffer
+from segments import forget_segments
+from sidecar import SidecarCache
+from timeindex import TimeIndex
+from pyramid import PyramidCache
+from timing import timer
+
+
+WORKERS = min(4, os.cpu_count() or 1)  # threads shared by all sources
+
+
+class Window():
+    """
+    What the plot frames get of one source: the timestamps,
+    their matplotlib date numbers and every column (raw for
+    "time [s]", converted for the thermometers) of the rows
+    in memory. All arrays are views of the ring buffers,
+    nothing is copied for the plots. changed holds the rows
+    (start, stop) per column that are new or were converted
+    again since the previous Window, column 0 stands for the
+    timestamps. start is the number of the first row in
+    memory, rows are numbered as in TailReader.rows_read.
+    """
+    def __init__(self, index, xnum, columns, changed, start=0):
+        self.index = index
+        self.xnum = xnum
+        self.columns = columns
+        self.changed = changed
+        self.start = start
+
+    def __len__(self):
+        return len(self.index)
+
+
+class IngestSource():
+    """
+    This class holds everything needed to read and convert
+    one .dat file: the TailReader, a RingBuffer of the
+    converted columns and date numbers in step with the
+    window of the reader, and the pyramid cache. Only the
+    new rows are converted, a column whose calibration
+    changed is converted again as a whole. Requests (window
+    length or time range, calibration per column, the
+    columns that are shown, None for all, and the settings
+    of the derived channels) wait in pending until a
+    thread of the IngestPool handles them, requests that
+    pile up in the mean time are handled as one. Columns
+    that are not asked for are neither parsed nor
+    converted, a (col, kind) column asks for a derived
+    channel of col. With cache=True the file is read
+    through a binary SidecarCache.
+    """
+    def __init__(self, path_to_file, n, cache=False):
+        sidecar = SidecarCache(path_to_file) if cache else None
+        self.reader = TailReader(path_to_file, n, sidecar, time_index=TimeIndex(path_to_file))
+        self.store = None
+        self.store_generation = None
+        self.calibrations = {}
+        self.derived = DerivedChannels()
+        self.pyramid_cache = PyramidCache()
+        self.pending = []
+        self.scheduled = False
+        self.last_request = None
+
+    def handle(self, requests, force=False):
+        n, calibrations, columns, settings, _ = requests[-1]
+        read = any(request[4] for request in requests)
+        force = force or not all(request[4] for request in requests)
+        timer.start("io", "parse", "convert", "derive", "pyramid")
+        derived = [] if columns is None else sorted({col[0] for col in columns if isinstance(col, tuple)})
+        if columns is not None:
+            columns = sorted({derived_column(col) for col in columns})
+        self.reader.set_length(n)
+        self.reader.set_columns(columns)
+        if read or not self.reader.loaded:
+            self.reader.read()
+            timer.count("rows", self.reader.new_rows)
+            if self.reader.new_rows == 0 and not force:
+                # nothing new in the file
+                return None
+        return self.convert(calibrations, derived, settings)
+
+    def reset(self):
+        # forget everything in memory, the next request reads the file again
+        self.reader.reset()
+        self.store = None
+        self.pyramid_cache.entries = {}
+
+    def convert(self, calibrations, derived=(), settings=DEFAULTS):
+        index, raw = self.reader.window()
+        stop = self.reader.rows_read
+        start = stop - len(index)
+        thermometers = [col for col in self.reader.columns if col > 1]
+        new = None if self.store is None or self.store_generation != self.reader.generation else stop - self.store.total
+        if new is None or new > len(index):
+            # a new window, converted as a whole
+            dtypes = {"xnum": float, **{col: float for col in thermometers}}
+            self.store = RingBuffer(self.reader.capacity(), dtypes, len(index))
+            self.store.total = start
+            self.store_generation = self.reader.generation
+            self.calibrations = {}
+            self.derived.reset()
+            new = len(index)
+            changed = {col: (start, stop) for col in [0] + self.reader.columns}
+        else:
+            changed = {col: (stop - new, stop) for col in [0] + self.reader.columns} if new else {}
+            for col in set(self.calibrations).difference(thermometers):
+                # no longer shown
+                self.store.drop(col)
+                self.pyramid_cache.entries.pop(col, None)
+        recalibrated = [col for col in thermometers
+                        if self.calibrations.get(col, calibrations[col]) != calibrations[col]]
+        if new:
+            appended = {"xnum": mdates.date2num(index[len(index) - new:])}
+            for col in thermometers:
+                with timer.stage("convert"):
+                    appended[col] = r_to_t_vec(calibrations[col])(raw[col][len(index) - new:])
+            self.store.append(appended)
+        for col in recalibrated:
+            with timer.stage("convert"):
+                self.store.replace(col, r_to_t_vec(calibrations[col])(raw[col]))
+            changed[col] = (start, stop)
+        self.calibrations = {col: calibrations[col] for col in thermometers}
+        with timer.stage("derive"):
+            first = self.derived.update(self.store, [col for col in derived if col in thermometers],
+                                        settings, new, recalibrated)
+        for col, row in first.items():
+            for kind in KINDS:
+                changed[(col, kind)] = (start + row, stop)
+        xnum = self.store.view("xnum")
+        columns = {col: raw[col] for col in self.reader.columns if col == 1}
+        pyramids = {}
+        for col in self.derived.columns:
+            for kind in KINDS:
+                columns[(col, kind)] = self.store.view((col, kind))
+        for col in thermometers:
+            columns[col] = self.store.view(col)
+            with timer.stage("pyramid"):
+                pyramids[col] = self.pyramid_cache.update(col, calibrations[col], xnum, columns[col],
+                                                          self.reader.generation, start, stop)
+        return Window(index, xnum, columns, changed, start), pyramids
+
+
+class IngestPool():
+    """
+    This class reads and converts any number of .dat files
+    with a fixed number of background threads, so the Tk
+    main loop only has to apply the results and draw, and
+    the load of several files does not grow with one thread
+    per file. Every file is added under a name, requests for
+    that name go in through request and (name, (Window,
+    pyramids)) or (name, exception) come out of the results
+    queue. A source is handled by one thread at a time and
+    sources take turns in the order they asked. Setting
+    profile_next runs the next request under cProfile, the
+    profile is left in self.profile before the result is
+    queued.
+    """
+    def __init__(self, workers=WORKERS):
+        self.sources = {}
+        self.lock = threading.Lock()
+        self.ready = queue.Queue()
+        self.results = queue.Queue()
+        self.profile_next = False
+        self.profile = None
+        self.threads = [threading.Thread(target=self.run, daemon=True) for _ in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def add(self, name, path_to_file, n, cache=False):
+        # replaces a source with the same name, results of the old one are dropped
+        with self.lock:
+            old = self.sources.get(name)
+            self.sources[name] = IngestSource(path_to_file, n, cache)
+            self.forget(old)
+
+    def remove(self, name):
+        with self.lock:
+            self.forget(self.sources.pop(name, None))
+        timer.discard(name)
+
+    def forget(self, source):
+        # called with the lock held, drops the decompressed segments of a
+        # source that is gone unless another source shows the same file
+        if source is None:
+            return
+        path = source.reader.path_to_file
+        if all(other.reader.path_to_file != path for other in self.sources.values()):
+            forget_segments(path)
+
+    def request(self, name, n, calibrations, columns=None, settings=DEFAULTS, read=True):
+        # read=False only converts the window that is already in memory,
+        # columns are the column numbers to read, None for all, settings
+        # are those of the derived channels
+        with self.lock:
+            source = self.sources[name]
+            source.last_request = (n, dict(calibrations), columns, settings)
+            self.schedule(name, source, source.last_request + (read,))
+
+    def refresh(self, name):
+        # reads the file again with the last window length and calibrations,
+        # safe to call from any thread (e.g. a FileWatcher)
+        with self.lock:
+            source = self.sources.get(name)
+            if source is not None and source.last_request is not None:
+                self.schedule(name, source, source.last_request + (True,))
+
+    def schedule(self, name, source, request):
+        # called with the lock held
+        source.pending.append(request)
+        if not source.scheduled:
+            source.scheduled = True
+            self.ready.put((name, source))
+
+    def stop(self):
+        for _ in self.threads:
+            self.ready.put(None)
+
+    def run(self):
+        while True:
+            item = self.ready.get()
+            if item is None:
+                return
+            name, source = item
+            with self.lock:
+                requests, source.pending = source.pending, []
+            profile = None
+            if self.profile_next:
+                self.profile_next = False
+                profile = cProfile.Profile()
+                profile.enable()
+            try:
+                result = source.handle(requests, force=profile is not None)
+            except Exception as error:
+                result = error
+            timer.publish(name)
+            if profile is not None:
+                profile.disable()
+                self.profile = profile
+            with self.lock:
+                if source.pending:
+                    self.ready.put((name, source))
+                else:
+                    source.scheduled = False
+                if result is not None and self.sources.get(name) is source:
+                    self.results.put((name, result))
@@ -0,0 +1,56 @@
+class DataModel():
+    """
+    This class holds the newest Window and pyramids of every
+    source and tells the plot frames what changed. Channels
+    are (source name, column), column 0 being the timestamps
+    and (col, kind) a derived channel of a thermometer.
+    A subscriber gives the channels it shows and is only
+    called, with {channel: (start, stop)} of the rows that
+    are new or were converted again, when one of them
+    changed. Rows are numbered as in TailReader.rows_read.
+    The subscribed channels are also the columns that have
+    to be read: demand(name) is called whenever they change
+    for a source, see columns.
+    """
+    def __init__(self, demand=None):
+        self.sources = {}
+        self.subscribers = {}
+        self.demand = demand
+
+    def subscribe(self, callback, channels):
+        # also used to change the channels of a subscriber
+        before = self.channels()
+        self.subscribers[callback] = set(channels)
+        self.changed_demand(before)
+
+    def unsubscribe(self, callback):
+        before = self.channels()
+        self.subscribers.pop(callback, None)
+        self.changed_demand(before)
+
+    def channels(self):
+        return set().union(*self.subscribers.values())
+
+    def changed_demand(self, before):
+        names = {name for name, col in before.symmetric_difference(self.channels()) if col != 0}
+        if self.demand is not None:
+            for name in names:
+                self.demand(name)
+
+    def columns(self, name):
+        # the columns of a source that any subscriber shows, also (col, kind)
+        # of derived channels, the timestamps are always read
+        return sorted((col for source, col in self.channels() if source == name and col != 0), key=str)
+
+    def update(self, results):
+        # results: source name -> (Window, pyramids), returns all changes
+        changes = {}
+        for name, (window, pyramids) in results.items():
+            self.sources[name] = (window, pyramids)
+            for col, rows in window.changed.items():
+                changes[(name, col)] = rows
+        for callback, channels in list(self.subscribers.items()):
+            relevant = {channel: rows for channel, rows in changes.items() if channel in channels}
+            if relevant:
+                callback(relevant)
+        return changes
@@ -1,22 +1,20 @@
+import cProfile
+import queue
 import tkinter as tk
-from tkinter import ttk
-from collections import deque
+from tkinter import ttk, filedialog
 
 import numpy as np
-import pandas as pd
-import matplotlib.colors as mcolors
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import matplotlib.backends.backend_tkagg as tkagg
-import matplotlib.dates as mdates
-from matplotlib.ticker import ScalarFormatter, AutoLocator
 
-from r_to_t import r_to_t, r_to_t_dict
+from r_to_t import r_to_t_dict
+from model import DataModel
+from derived import DEFAULTS
+from alarms import AlarmMonitor, AlarmRule, KINDS as ALARM_KINDS
+from timing import timer, save_profile
+from watcher import FileWatcher, MIN_INTERVAL
+from segments import base_name, order_segments, segment_paths, DECOMPRESSORS
 
-
-# Obtain matplotlib colors
-color_view = mcolors.TABLEAU_COLORS.values()
-color_dict = dict(zip(range(len(color_view)-2), color_view))
+# matplotlib and pandas take most of the startup time, plotframe, dat_reader
+# and ingest are imported when the first file is chosen, see add_source
 
 
 # Global values
@@ -24,49 +22,7 @@ ROW_AMOUNT = 2
 MAX_COLUMNS = 4
 R_TO_T_MAX = 20
 MAX_PLOTS = 6
-FIGSIZE = (6,3)
-
-LOCATOR = mdates.AutoDateLocator(minticks=3, maxticks=7)
-FORMATTER = mdates.ConciseDateFormatter(LOCATOR)
-
-
-class onofflabel(tk.Label):
-    def __init__(self, master, textvariable, active_color, command):
-        super().__init__(master=master, width=10, textvariable=textvariable)
-        self.bind("<Button-1>", lambda event: self.toggle(event))
-        self.bind("<Enter>", lambda event: self.hover(event))
-        self.bind("<Leave>", lambda event: self.leave_hover(event))
-
-        self.value = False
-        self.active_color = active_color
-        self.command = command
-
-    def toggle(self, event=None):
-        self.value = not self.value
-        if self.value:
-            self.configure(background=self.active_color)
-        else:
-            self.configure(background="SystemButtonFace")
-        self.command()
-
-    def hover(self, event):
-        self.configure(relief="solid")
-
-    def leave_hover(self, event):
-        self.configure(relief="flat")
-
-
-def read_n_last_lines(path_to_file, n):
-    with open(path_to_file, 'r') as f:
-        q = deque(f, n)  # lines read at the end
-
-    splitted_lines = [s.split("\t") for s in list(filter(None, '\n'.join(q).splitlines()))]
-    splitted_lines = [s for s in splitted_lines if "#" not in s[0]]
-    df = pd.DataFrame(splitted_lines)
-    df = df.set_index(list(df)[0])
-    df.index = pd.to_datetime(df.index.astype(str))
-    df = df.apply(pd.to_numeric)
-    return df
+RESULT_INTERVAL = 50  # ms between checks for finished data
 
 
 class Entrywidget(tk.Entry):
@@ -172,116 +128,100 @@ class Entrywidget(tk.Entry):
         self.callfunc()
 
 
-class Plotframe(ttk.LabelFrame):
-    def __init__(self, master, name, color, max_columns, names_dict):
-        self.name = tk.StringVar(value=name)
-        self.names_dict = names_dict
-
-        self.framelabel = ttk.Label(textvariable=self.name, foreground=color)
-        super().__init__(master=master, labelwidget=self.framelabel)
-        self.framelabel.bind("<Double-Button-1>", lambda event: print("verander naam"))
-
-        figureframe = tk.Frame(master=self)
-        figureframe.pack(side="left",fill='both',expand=True)#grid(row=0,column=0,rowspan=8,sticky="nsew")
-        self.fig = Figure(figsize=FIGSIZE, tight_layout=True)
-        self.ax = self.fig.add_subplot(111)
-        self.construct_lines(max_columns)
-        self.ax.set_xlabel('Time')
-        self.ax.set_ylabel('Temperature [mK]')
-        self.ax.grid()
-        self.canvas = FigureCanvasTkAgg(self.fig, master=figureframe)
-        self.canvas.draw()
-        self.canvas.get_tk_widget().pack(side="top",fill='both',expand=True)
-        self.navtoolbar = tkagg.NavigationToolbar2Tk(self.canvas, figureframe)
-
-        self.plotcontrolframe = tk.Frame(master=self)
-        self.plotcontrolframe.pack(side="left", fill="both")
-
-        lockframelabel = ttk.Label(text="lock", foreground="black")
-        lockframe = ttk.LabelFrame(master=self.plotcontrolframe, labelwidget=lockframelabel)
-        lockframe.grid(row=0, column=0, sticky="nsew")
-        self.lockxvar = tk.BooleanVar(value="1")
-        self.lockyvar = tk.BooleanVar(value="1")
-        self.lockx = ttk.Checkbutton(master=lockframe, text="x axis", variable=self.lockxvar, command=self.plotupdate)
-        self.locky = ttk.Checkbutton(master=lockframe, text="y axis", variable=self.lockyvar, command=self.plotupdate)
-        self.lockx.state(["selected"])
-        self.locky.state(["selected"])
-        self.lockx.pack()
-        self.locky.pack()
-
-        self.update_axis_controls(max_columns)
-
-    def update_axis_controls(self, max_columns):
-        xdataframelabel = ttk.Label(text="x axis", foreground="black")
-        xdataframe = ttk.LabelFrame(master=self.plotcontrolframe, labelwidget=xdataframelabel)
-        xdataframe.grid(row=1, column=0, sticky="nsew")
-        self.xdatacbb = ttk.Combobox(xdataframe, width=10, state="readonly")
-        xdata_keys = [f"column {i}" for i in range(max_columns + 1)]
-        xdata_keys[0] = "real time"
-        xdata_keys[1] = "time [s]"
-        self.xdata_dict = dict(zip(xdata_keys, range(max_columns + 1)))
-        self.xdatacbb["values"] = list(self.xdata_dict.keys())
-        self.xdatacbb.set("real time")
-        self.xdatacbb.pack()
-        self.xdatacbb.bind("<<ComboboxSelected>>", lambda event: self.plotupdate(event))
-
-        ydataframelabel = ttk.Label(text="y axis", foreground="black")
-        ydataframe = ttk.LabelFrame(master=self.plotcontrolframe, labelwidget=ydataframelabel)
-        ydataframe.grid(row=2, column=0, sticky="nsew")
-        self.ydatadict = {}
-        for i in range(2, max_columns + 1):
-            self.ydatadict[i] = onofflabel(master=ydataframe, textvariable=self.names_dict[i], active_color=color_dict[i-2], command=self.plotupdate)
-            self.ydatadict[i].pack()
-
-    def construct_lines(self, max_columns):
-        self.line_dict = {}
-        for i in range(2, max_columns + 1):
-            self.line_dict[i], = self.ax.plot([], [])
-
-    def change_position(self, new_name, new_color):
-        self.framelabel.configure(text=new_name, foreground=new_color)
-
-    def plotupdate(self, event=None):
-        for i, line in self.line_dict.items():
-            xent = self.xdata_dict[self.xdatacbb.get()]
-            if xent == 0:
-                # use datetime format on x axis
-                tempx = self.df.index.to_numpy()
-                self.ax.xaxis.set_major_locator(LOCATOR)
-                self.ax.xaxis.set_major_formatter(FORMATTER)
-                self.ax.set_xlabel('Time')
-            elif xent == 1:
-                # use scalar format on x axis
-                tempx = self.df[xent].to_numpy()
-                self.ax.xaxis.set_major_locator(AutoLocator())
-                self.ax.xaxis.set_major_formatter(ScalarFormatter())
-                self.ax.set_xlabel('Time [s]')
-            else:
-                # use scalar format on x axis
-                tempx = self.df[xent].to_numpy()
-                self.ax.xaxis.set_major_locator(AutoLocator())
-                self.ax.xaxis.set_major_formatter(ScalarFormatter())
-                self.ax.set_xlabel('Temperature (mK)')
-            tempy = self.df[i].to_numpy()
-            line.set_data(tempx, tempy)
-            line.set_visible(self.ydatadict[i].value)
-        self.ax.redraw_in_frame()
-        self.ax.relim(visible_only=True)
-        if self.lockxvar.get():
-            self.ax.autoscale(axis="x")
-        if self.lockyvar.get():
-            self.ax.autoscale(axis="y")
-        self.canvas.draw()
-        self.navtoolbar.update()
-
-    def add_data(self, df):
-        self.df = df
-
-    def change_name(self, name):
-        self.name.set(name)
-
-    def remove_window(self):
-        self.destroy() 
+class Datasource():
+    """
+    This class holds what the window knows about one .dat
+    file: its name and the thermometer names and calibration
+    comboboxes per column. The data itself is in the
+    DataModel.
+    """
+    def __init__(self, name, filename, max_columns):
+        self.name = name
+        self.filename = filename
+        self.max_columns = max_columns
+        self.names_dict = {}
+        self.calibration_dict = {}
+
+    def channels(self):
+        return [(self.name, i) for i in range(2, self.max_columns + 1)]
+
+
+class Alarmwindow(tk.Toplevel):
+    """
+    Rules and events of the AlarmMonitor. A rule is a
+    source, a thermometer column, one of the alarm kinds
+    and a limit: mK for above and below, mK/min for rate
+    and seconds for stale (which ignores the column).
+    """
+    def __init__(self, master, sources, alarms):
+        super().__init__(master)
+        self.title("Alarms")
+        self.sources = sources
+        self.alarms = alarms
+        self.shown = 0
+
+        self.source_cbb = ttk.Combobox(master=self, width=12, state="readonly")
+        self.source_cbb.bind("<<ComboboxSelected>>", self.update_columns)
+        self.column_cbb = ttk.Combobox(master=self, width=4, state="readonly")
+        self.kind_cbb = ttk.Combobox(master=self, width=6, state="readonly", values=ALARM_KINDS)
+        self.kind_cbb.set(ALARM_KINDS[0])
+        self.limit_ent = tk.Entry(master=self, width=8)
+        self.limit_ent.bind('<Return>', self.add_rule)
+        add_btn = tk.Button(master=self, text="add", command=self.add_rule)
+        for column, widget in enumerate([self.source_cbb, self.column_cbb, self.kind_cbb, self.limit_ent, add_btn]):
+            widget.grid(row=0, column=column, sticky="nsew")
+
+        self.rule_list = tk.Listbox(master=self, height=5, selectmode="extended")
+        self.rule_list.grid(row=1, column=0, columnspan=4, sticky="nsew")
+        remove_btn = tk.Button(master=self, text="remove", command=self.remove_rule)
+        remove_btn.grid(row=1, column=4, sticky="new")
+
+        self.event_text = tk.Text(master=self, height=12, width=70, state="disabled")
+        self.event_text.grid(row=2, column=0, columnspan=5, sticky="nsew")
+
+        self.update_sources()
+        self.show_events()
+
+    def update_sources(self):
+        self.source_cbb["values"] = list(self.sources)
+        if not self.source_cbb.get() and self.sources:
+            self.source_cbb.set(next(iter(self.sources)))
+            self.update_columns()
+
+    def update_columns(self, event=None):
+        source = self.sources[self.source_cbb.get()]
+        self.column_cbb["values"] = list(range(2, source.max_columns + 1))
+        self.column_cbb.set(2)
+
+    def add_rule(self, event=None):
+        try:
+            limit = float(self.limit_ent.get())
+        except ValueError:
+            return
+        if self.source_cbb.get():
+            self.alarms.add(AlarmRule(self.source_cbb.get(), int(self.column_cbb.get()), self.kind_cbb.get(), limit))
+            self.show_rules()
+
+    def remove_rule(self):
+        for i in reversed(self.rule_list.curselection()):
+            self.alarms.remove(self.alarms.rules[i])
+        self.show_rules()
+
+    def show_rules(self):
+        self.rule_list.delete(0, "end")
+        for rule in self.alarms.rules:
+            self.rule_list.insert("end", f"{'ALARM' if rule.active else 'ok':<6}{rule.describe()}")
+
+    def show_events(self):
+        # only the events since the last call are added
+        new = min(self.alarms.count - self.shown, len(self.alarms.events))
+        if new:
+            self.event_text.config(state="normal")
+            self.event_text.insert("end", "".join(text + "\n" for text in list(self.alarms.events)[-new:]))
+            self.event_text.see("end")
+            self.event_text.config(state="disabled")
+        self.shown = self.alarms.count
+        self.show_rules()
 
 
 class Mainwindow():
@@ -291,16 +231,25 @@ class Mainwindow():
         self.mainwindow.protocol("WM_DELETE_WINDOW", self.quit_me)
 
         # keep track of used plot numbers
-        self.used_dict = dict(zip(range(len(color_view)-2), np.zeros(len(color_view))))
+        self.used_dict = dict(zip(range(MAX_PLOTS), np.zeros(MAX_PLOTS)))
         self.frame_dict = {}
-        self.chosen_channels = dict(zip(range(len(color_view)-2), np.zeros(len(color_view))))
+        self.chosen_channels = dict(zip(range(MAX_PLOTS), np.zeros(MAX_PLOTS)))
         self.name_dict = {}
         self.data_loaded = False
-        self.max_columns = 0
+        self.sources = {}
+        self.model = DataModel(demand=self.request_columns)
+        self.alarms = AlarmMonitor(self.model)
+        self.alarm_state = (0, 0)
+        self.alarmwindow = None
+        self.pool = None  # created with the first source
+        self.watcher = FileWatcher(self.refresh)
+        self.watcher.start()
+        self.read = False
 
         #self.construct_menu()
         self.construct_controls()
 
+        self.mainwindow.after(RESULT_INTERVAL, self.apply_results)
         self.mainwindow.mainloop()
 
     def construct_menu(self):
@@ -322,6 +271,10 @@ class Mainwindow():
         self.plotframe = tk.Frame(master=self.mainwindow)
         self.plotframe.grid(row=0, column=1, rowspan=2, sticky="nsew")
 
+        # one thermometer frame per source
+        self.sourceframe = tk.Frame(master=self.mainwindow)
+        self.sourceframe.grid(row=1, column=0, sticky="nsew")
+
         self.add_plot_btn = tk.Button(controlframe, text="add plot", command=self.add_plot)
         self.add_plot_btn.grid(row=0, column=0, sticky="nsew")
 
@@ -343,8 +296,20 @@ class Mainwindow():
         last_points_lbl.grid(row=3,column=0)
         self.last_points_ent.grid(row=3,column=1)
 
-        empty_label2 = tk.Label(master=controlframe)
-        empty_label2.grid(row=4, column=0, columnspan=2, sticky="nsew")
+        # a time range instead of the last points, "to" left empty follows the new points
+        rangeframe = tk.Frame(master=controlframe)
+        rangeframe.grid(row=4, column=0, columnspan=2, sticky="nsew", pady=5)
+        self.range_vars = []
+        self.range_ents = []
+        for row, text in enumerate(["from", "to"]):
+            var = tk.StringVar()
+            lbl = tk.Label(master=rangeframe, text=text)
+            ent = tk.Entry(master=rangeframe, width=19, textvariable=var)
+            ent.bind('<Return>', self.read_data)
+            lbl.grid(row=row, column=0)
+            ent.grid(row=row, column=1)
+            self.range_vars.append(var)
+            self.range_ents.append(ent)
 
         self.start_btn = tk.Button(master=controlframe, text="start", command=self.start_reading)
         self.start_btn.grid(row=5, column=0, sticky="nsew")
@@ -352,36 +317,89 @@ class Mainwindow():
         self.stop_btn = tk.Button(master=controlframe, text="stop", command=self.stop_reading)
         self.stop_btn.grid(row=5, column=1, sticky="nsew")
 
+        # binary cache next to the .dat file, needed to show the whole history
+        self.cache_var = tk.BooleanVar(value=False)
+        self.history_var = tk.BooleanVar(value=False)
+        self.cache_btn = ttk.Checkbutton(master=controlframe, text="cache", variable=self.cache_var, command=self.toggle_cache)
+        self.history_btn = ttk.Checkbutton(master=controlframe, text="all", variable=self.history_var, command=self.toggle_history)
+        self.cache_btn.grid(row=6, column=0, sticky="nsew")
+        self.history_btn.grid(row=6, column=1, sticky="nsew")
+
+        # minimum time between two refreshes of a file while reading
+        self.interval_var = tk.StringVar()
+        interval_lbl = tk.Label(master=controlframe, text="interval [s]")
+        self.interval_ent = Entrywidget(master=controlframe,
+                                        width=6,
+                                        minmax=[0,60],
+                                        callfunc=self.set_interval,
+                                        textvariable=self.interval_var)
+        self.interval_ent.insert(0, MIN_INTERVAL)
+        interval_lbl.grid(row=7, column=0)
+        self.interval_ent.grid(row=7, column=1)
+
+        # settings of the derived channels (rolling mean, std, dT/dt, stable)
+        self.derived_vars = []
+        for row, (text, minmax, default) in enumerate(zip(["average [min]", "stable [%]", "stable [min]"],
+                                                         [[0, 10000], [0, 100], [0, 10000]], DEFAULTS)):
+            var = tk.StringVar()
+            lbl = tk.Label(master=controlframe, text=text)
+            ent = Entrywidget(master=controlframe, width=6, minmax=minmax, callfunc=self.derive_data,
+                              textvariable=var)
+            ent.insert(0, f"{default:g}")
+            lbl.grid(row=8 + row, column=0)
+            ent.grid(row=8 + row, column=1)
+            self.derived_vars.append(var)
+
+        # time per stage of the last refresh
+        self.log_var = tk.BooleanVar(value=False)
+        self.log_btn = ttk.Checkbutton(master=controlframe, text="log", variable=self.log_var, command=self.toggle_log)
+        self.profile_btn = tk.Button(master=controlframe, text="profile", command=self.profile_refresh)
+        self.log_btn.grid(row=11, column=0, sticky="nsew")
+        self.profile_btn.grid(row=11, column=1, sticky="nsew")
+
+        self.timing_var = tk.StringVar()
+        timing_lbl = tk.Label(master=controlframe, textvariable=self.timing_var, justify="left")
+        timing_lbl.grid(row=12, column=0, columnspan=2, sticky="nsew")
+
+        # alarm rules and whether any of them is on
+        self.alarm_btn = tk.Button(master=controlframe, text="alarms", command=self.show_alarms)
+        self.alarm_var = tk.StringVar(value="no alarms")
+        self.alarm_lbl = tk.Label(master=controlframe, textvariable=self.alarm_var)
+        self.alarm_background = self.alarm_lbl.cget("background")
+        self.alarm_btn.grid(row=13, column=0, sticky="nsew")
+        self.alarm_lbl.grid(row=13, column=1, sticky="nsew")
+
         self.add_plot_btn.config(state="disabled")
         self.last_points_ent.config(state="disabled")
         self.start_btn.config(state="disabled")
         self.stop_btn.config(state="disabled")
-
-    def thermometer_setup(self, max_columns):
-        framelabel = ttk.Label(text="Thermometers", foreground="#fd04d9")
-        thermometerframe = ttk.LabelFrame(master=self.mainwindow, labelwidget=framelabel)
-        thermometerframe.grid(row=1, column=0, sticky="nsew")
-
-        self.thermometer_var_dict = {}
-        self.thermometer_func_dict = {}
-
-        for i in range(2, max_columns + 1):
-            self.thermometer_var_dict[i] = tk.StringVar(value=i)
-            entry = tk.Entry(master=thermometerframe, textvariable=self.thermometer_var_dict[i], width=12)
+        self.history_btn.config(state="disabled")
+        self.profile_btn.config(state="disabled")
+        self.alarm_btn.config(state="disabled")
+
+    def thermometer_setup(self, source):
+        framelabel = ttk.Label(text=f"Thermometers {source.name}", foreground="#fd04d9")
+        thermometerframe = ttk.LabelFrame(master=self.sourceframe, labelwidget=framelabel)
+        thermometerframe.pack(side="top", fill="x")
+
+        for i in range(2, source.max_columns + 1):
+            source.names_dict[i] = tk.StringVar(value=i)
+            entry = tk.Entry(master=thermometerframe, textvariable=source.names_dict[i], width=12)
             combo = ttk.Combobox(master=thermometerframe, width=8, state="readonly")
             combo["values"] = list(r_to_t_dict.keys())
             combo.set("no conv.")
-            combo.bind("<<ComboboxSelected>>", lambda event: self.read_data(event))
+            combo.bind("<<ComboboxSelected>>", lambda event, name=source.name: self.convert_data(name))
             entry.grid(row=i-2, column=0)
             combo.grid(row=i-2, column=1)
-            self.thermometer_func_dict[i] = combo
+            source.calibration_dict[i] = combo
 
 
     def add_plot(self):
+        from plotframe import Plotframe, color_dict
         total_plots = int(sum(self.used_dict.values()))
         if total_plots < MAX_PLOTS:
             plot_number = min([i for i, val in self.used_dict.items() if val == 0])
-            frame = Plotframe(self.plotframe, plot_number, color_dict[plot_number], self.max_columns, self.thermometer_var_dict)
+            frame = Plotframe(self.plotframe, plot_number, color_dict[plot_number], self.sources, self.model)
 
             self.used_dict[plot_number] = True
 
@@ -394,11 +412,13 @@ class Mainwindow():
             # self.plotmenu.add_command(label=f"Plot {plot_number}", command=lambda: self.change_plot_name(plot_number))
 
             if self.data_loaded:
-                frame.add_data(self.df)
-                frame.ydatadict[plot_number + 2].toggle()
+                key = (next(iter(self.sources)), plot_number + 2)
+                if key in frame.ydatadict:
+                    frame.ydatadict[key].toggle()
                 frame.plotupdate()
 
     def remove_plot(self, number):
+        from plotframe import color_dict
         self.frame_dict[number].remove_window()
         self.frame_dict.pop(number)
         self.name_dict.pop(number)
@@ -447,62 +467,230 @@ class Mainwindow():
         self.frame_dict[number].change_name(name)
 
     def choose_file(self):
-        self.filename = tk.filedialog.askopenfilename(title="Choose file", 
-                                                      filetypes=[('Data File in DAT Format', '*.dat')])
-        if self.filename:
+        # every choice is added as another source, e.g. one per fridge;
+        # several files chosen at once are the segments of one run
+        patterns = ["*.dat"] + [f"*.dat{extension}" for extension in DECOMPRESSORS]
+        filenames = filedialog.askopenfilenames(title="Choose file", 
+                                                filetypes=[('Data File in DAT Format', patterns),
+                                                           ('All files', '*')])
+        if not filenames:
+            return
+        filename = filenames[0] if len(filenames) == 1 else order_segments(filenames)
+        if filename not in [source.filename for source in self.sources.values()]:
+            self.add_source(filename)
+
+    def add_source(self, filename):
+        from dat_reader import read_n_last_lines
+        if self.pool is None:
+            from ingest import IngestPool
+            self.pool = IngestPool()
+        name = base_name(filename)
+        number = 2
+        while name in self.sources:
+            name = f"{base_name(filename)} ({number})"
+            number += 1
+        max_columns = len(read_n_last_lines(filename, 2).columns)
+        source = Datasource(name, filename, max_columns)
+        if not self.sources:
             self.construct_menu()
-            max_columns = len(read_n_last_lines(self.filename, 2).columns)
-            if max_columns != self.max_columns:
-                self.thermometer_setup(max_columns)
-                self.max_columns = max_columns
-            if not self.data_loaded:
-                self.add_plot()
-            self.read_data()
-            self.last_points_ent.config(state="normal")
-            self.start_btn.config(state="normal")
-            self.add_plot_btn.config(state="normal")
-
-    def plotupdate(self, event=None):
-        for key, frame in self.frame_dict.items():
-            frame.add_data(self.df)
-            frame.plotupdate()
+        self.sources[name] = source
+        self.thermometer_setup(source)
+        self.pool.add(name, filename, self.window_length(), self.cache_var.get())
+        for frame in self.frame_dict.values():
+            frame.update_sources(self.sources)
+        if not self.frame_dict:
+            self.add_plot()
+        # show the first thermometer, which also asks for its column
+        label = self.frame_dict[0].ydatadict.get((name, 2))
+        if label is not None and not label.value:
+            label.toggle()
+        self.pool.request(name, self.window_length(), self.calibrations(source), self.model.columns(name),
+                          self.derived_settings())
+        self.update_window_controls()
+        self.start_btn.config(state="normal")
+        self.add_plot_btn.config(state="normal")
+        self.profile_btn.config(state="normal")
+        self.alarm_btn.config(state="normal")
+        if self.alarmwindow is not None and self.alarmwindow.winfo_exists():
+            self.alarmwindow.update_sources()
+
+    def plotupdate(self, results):
+        # only the frames that show a changed channel are redrawn
+        timer.start("draw")
+        with timer.stage("draw"):
+            self.model.update(results)
+        timer.count("points", sum(len(line.get_xdata()) for frame in self.frame_dict.values()
+                                  for line in frame.line_dict.values() if line.get_visible()))
+        self.timing_var.set(timer.summary())
+        timer.log()
 
     def toggle_channel_dict(self, choices):
         for key, val in self.chosen_channels.items():
             self.chosen_channels[key] += choices[key]
 
+    def toggle_cache(self):
+        if not self.cache_var.get():
+            self.history_var.set(False)
+        if self.data_loaded:
+            self.update_window_controls()
+            for name, source in self.sources.items():
+                self.pool.add(name, source.filename, self.window_length(), self.cache_var.get())
+            self.read_data()
+
+    def toggle_history(self):
+        self.update_window_controls()
+        self.read_data()
+
+    def toggle_log(self):
+        if self.log_var.get():
+            timer.enable_log()
+        else:
+            timer.disable_log()
+
+    def profile_refresh(self):
+        # the next refresh runs under cProfile, see apply_results
+        self.pool.profile_next = True
+        self.read_data()
+
+    def update_window_controls(self):
+        self.history_btn.config(state="normal" if self.cache_var.get() else "disabled")
+        self.last_points_ent.config(state="disabled" if self.history_var.get() or self.time_span() else "normal")
+
+    def time_span(self):
+        # (start, stop) of the from and to entries, None without a valid start
+        times = []
+        for var, ent in zip(self.range_vars, self.range_ents):
+            try:
+                times.append(np.datetime64(var.get().strip(), "ns") if var.get().strip() else None)
+                ent.config(foreground="black")
+            except ValueError:
+                times.append(None)
+                ent.config(foreground="red")
+        if times[0] is None:
+            return None
+        return tuple(times)
+
+    def window_length(self):
+        # None shows every row of the file, a tuple the rows of a time range
+        span = self.time_span()
+        if span is not None:
+            return span
+        if self.history_var.get():
+            return None
+        return int(self.last_points_var.get())
+
+    def calibrations(self, source):
+        return {col: r_to_t_dict[combo.get()] for col, combo in source.calibration_dict.items()}
+
+    def derived_settings(self):
+        return tuple(float(var.get()) for var in self.derived_vars)
+
     def read_data(self, event=None):
-        self.df = read_n_last_lines(self.filename, int(self.last_points_var.get()))
-        for col in self.df.columns[1:]:
-            self.df[col] = self.df[col].transform(r_to_t(r_to_t_dict[self.thermometer_func_dict[col].get()]))
-        if not self.data_loaded:
-            self.plotupdate()
-            self.frame_dict[0].ydatadict[2].toggle()
+        if self.sources:
+            self.update_window_controls()
+        for name, source in self.sources.items():
+            self.pool.request(name, self.window_length(), self.calibrations(source), self.model.columns(name),
+                              self.derived_settings())
+
+    def convert_data(self, name):
+        source = self.sources[name]
+        self.pool.request(name, self.window_length(), self.calibrations(source), self.model.columns(name),
+                          self.derived_settings(), read=False)
+
+    def derive_data(self):
+        for name in self.sources:
+            self.convert_data(name)
+
+    def request_columns(self, name):
+        # called by the model when other columns of a source are shown,
+        # a new column is read with the window, others are dropped
+        if name in self.sources:
+            self.convert_data(name)
+
+    def refresh(self, name):
+        # called by the watcher thread when a file changed
+        self.pool.refresh(name)
+
+    def apply_results(self):
+        # runs in the Tk main loop, only picks up the newest finished dataframe per source
+        results = {}
+        while self.pool is not None:
+            try:
+                name, result = self.pool.results.get_nowait()
+            except queue.Empty:
+                break
+            results[name] = result
+        self.mainwindow.after(RESULT_INTERVAL, self.apply_results)
+        for result in results.values():
+            if isinstance(result, Exception):
+                raise result
+        results = {name: result for name, result in results.items() if name in self.sources}
+        if results and self.pool.profile is not None:
+            pool_profile, self.pool.profile = self.pool.profile, None
+            profile = cProfile.Profile()
+            profile.runcall(self.show_data, results)
+            save_profile([pool_profile, profile])
+        elif results:
+            self.show_data(results)
+        if self.read:
+            self.alarms.check()
+        self.update_alarms()
+
+    def show_data(self, results):
         self.data_loaded = True
-        # self.max_columns = len(self.df.columns)
-        # for key, frame in self.frame_dict.items():
-        #     frame.update_axis_controls(self.max_columns)
-        self.plotupdate()
+        self.plotupdate(results)
+
+    def show_alarms(self):
+        if self.alarmwindow is not None and self.alarmwindow.winfo_exists():
+            self.alarmwindow.lift()
+        else:
+            self.alarmwindow = Alarmwindow(self.mainwindow, self.sources, self.alarms)
+
+    def update_alarms(self):
+        # the indicator only changes with an event or another set of rules
+        state = (self.alarms.count, len(self.alarms.rules))
+        if state == self.alarm_state:
+            return
+        self.alarm_state = state
+        active = self.alarms.active()
+        if active:
+            self.alarm_var.set(f"ALARM ({len(active)})")
+            self.alarm_lbl.config(background="red", foreground="white")
+            self.mainwindow.title('ALARM - Thermometers Wim')
+        else:
+            self.alarm_var.set("no alarms")
+            self.alarm_lbl.config(background=self.alarm_background, foreground="black")
+            self.mainwindow.title('Thermometers Wim')
+        if self.alarmwindow is not None and self.alarmwindow.winfo_exists():
+            self.alarmwindow.show_events()
 
     def start_reading(self):
+        # the watcher asks the pool for a refresh whenever a file changes
         self.start_btn.config(state="disabled")
         self.stop_btn.config(state="normal")
         self.choose_file_btn.config(state="disabled")
         self.read = True
-        self.mainwindow.after(1000, self.read_in_loop)
+        self.alarms.restart()
+        for name, source in self.sources.items():
+            # only the newest segment grows
+            self.watcher.watch(name, segment_paths(source.filename)[-1])
+        self.read_data()
 
     def stop_reading(self):
         self.start_btn.config(state="normal")
         self.stop_btn.config(state="disabled")
         self.choose_file_btn.config(state="normal")
         self.read = False
+        for name in self.sources:
+            self.watcher.unwatch(name)
 
-    def read_in_loop(self):
-        if self.read:
-            self.read_data()
-        self.mainwindow.after(5000, self.read_in_loop)
+    def set_interval(self):
+        self.watcher.set_interval(float(self.interval_var.get()))
 
     def quit_me(self):
+        self.watcher.stop()
+        if self.pool is not None:
+            self.pool.stop()
         self.mainwindow.quit()
         self.mainwindow.destroy()
 
@@ -0,0 +1,318 @@
+"""
+The plots of the main window. Everything that needs matplotlib is in this
+module, plot_temperature_wim imports it the first time a plot is made, so
+the window opens without waiting for matplotlib.
+"""
+import tkinter as tk
+from tkinter import ttk
+
+import numpy as np
+import matplotlib.colors as mcolors
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+import matplotlib.backends.backend_tkagg as tkagg
+import matplotlib.dates as mdates
+from matplotlib.ticker import ScalarFormatter, AutoLocator
+
+from decimate import minmax_indices
+
+
+# Obtain matplotlib colors
+color_view = mcolors.TABLEAU_COLORS.values()
+color_dict = dict(zip(range(len(color_view)-2), color_view))
+
+FIGSIZE = (6,3)
+
+# y data of a plot: the derived channel (see derived.py) and the axis label
+YDATA = {"value": (None, 'Temperature [mK]'),
+         "rolling mean": ("mean", 'Mean [mK]'),
+         "rolling std": ("std", 'Std [mK]'),
+         "dT/dt": ("dT/dt", 'dT/dt [mK/min]'),
+         "stable": ("stable", 'Stable')}
+
+
+
+class onofflabel(tk.Label):
+    def __init__(self, master, textvariable, active_color, command):
+        super().__init__(master=master, width=10, textvariable=textvariable)
+        self.bind("<Button-1>", lambda event: self.toggle(event))
+        self.bind("<Enter>", lambda event: self.hover(event))
+        self.bind("<Leave>", lambda event: self.leave_hover(event))
+
+        self.value = False
+        self.active_color = active_color
+        self.command = command
+
+    def toggle(self, event=None):
+        self.set(not self.value)
+        self.command()
+
+    def set(self, value):
+        self.value = value
+        if self.value:
+            self.configure(background=self.active_color)
+        else:
+            self.configure(background="SystemButtonFace")
+
+    def hover(self, event):
+        self.configure(relief="solid")
+
+    def leave_hover(self, event):
+        self.configure(relief="flat")
+
+
+class Navigationtoolbar(tkagg.NavigationToolbar2Tk):
+    def save_figure(self, *args):
+        # the lines are animated for blitting, savefig leaves those out
+        lines = self.canvas.figure.axes[0].get_lines()
+        for line in lines:
+            line.set_animated(False)
+        try:
+            return super().save_figure(*args)
+        finally:
+            for line in lines:
+                line.set_animated(True)
+            self.canvas.draw()
+
+
+class Plotframe(ttk.LabelFrame):
+    """
+    Plot of the thermometer columns of any of the sources,
+    every line is identified by (source name, column). The
+    frame subscribes to the DataModel for the lines it shows
+    and their x column, new data for other channels does not
+    redraw it.
+    """
+    def __init__(self, master, name, color, sources, model):
+        self.name = tk.StringVar(value=name)
+        self.model = model
+
+        self.framelabel = ttk.Label(textvariable=self.name, foreground=color)
+        super().__init__(master=master, labelwidget=self.framelabel)
+        self.framelabel.bind("<Double-Button-1>", lambda event: print("verander naam"))
+
+        figureframe = tk.Frame(master=self)
+        figureframe.pack(side="left",fill='both',expand=True)#grid(row=0,column=0,rowspan=8,sticky="nsew")
+        self.fig = Figure(figsize=FIGSIZE, tight_layout=True)
+        self.ax = self.fig.add_subplot(111)
+        self.construct_lines(sources)
+        self.ax.set_xlabel('Time')
+        self.ax.set_ylabel('Temperature [mK]')
+        self.ax.grid()
+        self.background = None
+        self.xent = None
+        self.ychoice = "value"
+        self.data_dict = {}
+        self.ax.callbacks.connect("xlim_changed", self.decimate_lines)
+        self.canvas = FigureCanvasTkAgg(self.fig, master=figureframe)
+        self.canvas.mpl_connect("draw_event", self.on_draw)
+        self.canvas.draw()
+        self.canvas.get_tk_widget().pack(side="top",fill='both',expand=True)
+        self.navtoolbar = Navigationtoolbar(self.canvas, figureframe)
+
+        self.plotcontrolframe = tk.Frame(master=self)
+        self.plotcontrolframe.pack(side="left", fill="both")
+
+        lockframelabel = ttk.Label(text="lock", foreground="black")
+        lockframe = ttk.LabelFrame(master=self.plotcontrolframe, labelwidget=lockframelabel)
+        lockframe.grid(row=0, column=0, sticky="nsew")
+        self.lockxvar = tk.BooleanVar(value="1")
+        self.lockyvar = tk.BooleanVar(value="1")
+        self.lockx = ttk.Checkbutton(master=lockframe, text="x axis", variable=self.lockxvar, command=self.plotupdate)
+        self.locky = ttk.Checkbutton(master=lockframe, text="y axis", variable=self.lockyvar, command=self.plotupdate)
+        self.lockx.state(["selected"])
+        self.locky.state(["selected"])
+        self.lockx.pack()
+        self.locky.pack()
+
+        self.axisframes = []
+        self.xdatacbb = None
+        self.ydatacbb = None
+        self.ydatadict = {}
+        self.update_axis_controls(sources)
+
+    def update_axis_controls(self, sources):
+        # Also called when a source is added, the chosen x axis and
+        # visible lines are kept. Against a column, every line uses
+        # that column of its own source.
+        xchoice = self.xdatacbb.get() if self.xdatacbb is not None else "real time"
+        ychoice = self.ydatacbb.get() if self.ydatacbb is not None else "value"
+        visible = {key for key, label in self.ydatadict.items() if label.value}
+        for frame in self.axisframes:
+            frame.destroy()
+
+        max_columns = max([source.max_columns for source in sources.values()], default=1)
+        xdataframelabel = ttk.Label(text="x axis", foreground="black")
+        xdataframe = ttk.LabelFrame(master=self.plotcontrolframe, labelwidget=xdataframelabel)
+        xdataframe.grid(row=1, column=0, sticky="nsew")
+        self.xdatacbb = ttk.Combobox(xdataframe, width=10, state="readonly")
+        xdata_keys = [f"column {i}" for i in range(max_columns + 1)]
+        xdata_keys[0] = "real time"
+        xdata_keys[1] = "time [s]"
+        self.xdata_dict = dict(zip(xdata_keys, range(max_columns + 1)))
+        self.xdatacbb["values"] = list(self.xdata_dict.keys())
+        self.xdatacbb.set(xchoice if xchoice in self.xdata_dict else "real time")
+        self.xdatacbb.pack()
+        self.xdatacbb.bind("<<ComboboxSelected>>", lambda event: self.plotupdate(event))
+
+        ydataframelabel = ttk.Label(text="y axis", foreground="black")
+        ydataframe = ttk.LabelFrame(master=self.plotcontrolframe, labelwidget=ydataframelabel)
+        ydataframe.grid(row=2, column=0, sticky="nsew")
+        # the thermometers themselves or one of their derived channels
+        self.ydatacbb = ttk.Combobox(ydataframe, width=10, state="readonly")
+        self.ydatacbb["values"] = list(YDATA.keys())
+        self.ydatacbb.set(ychoice)
+        self.ydatacbb.pack()
+        self.ydatacbb.bind("<<ComboboxSelected>>", lambda event: self.plotupdate(event))
+        self.ydatadict = {}
+        for source in sources.values():
+            if len(sources) > 1:
+                tk.Label(master=ydataframe, text=source.name).pack()
+            for key in source.channels():
+                self.ydatadict[key] = onofflabel(master=ydataframe, textvariable=source.names_dict[key[1]],
+                                                 active_color=self.line_dict[key].get_color(), command=self.plotupdate)
+                self.ydatadict[key].set(key in visible)
+                self.ydatadict[key].pack()
+        self.axisframes = [xdataframe, ydataframe]
+
+    def construct_lines(self, sources):
+        # lines of channels that are already plotted are kept
+        old_lines = getattr(self, "line_dict", {})
+        self.line_dict = {}
+        keys = [key for source in sources.values() for key in source.channels()]
+        for k, key in enumerate(keys):
+            if key in old_lines:
+                self.line_dict[key] = old_lines.pop(key)
+            else:
+                self.line_dict[key], = self.ax.plot([], [], color=color_dict[k % len(color_dict)], animated=True,
+                                                    visible=False)
+        for line in old_lines.values():
+            line.remove()
+
+    def update_sources(self, sources):
+        self.construct_lines(sources)
+        self.update_axis_controls(sources)
+
+    def change_position(self, new_name, new_color):
+        self.framelabel.configure(text=new_name, foreground=new_color)
+
+    def plotupdate(self, event=None):
+        # Only the lines are redrawn on top of the cached background,
+        # unless the limits, the x axis format or the visible lines change.
+        full_draw = self.background is None
+        limits = (self.ax.get_xlim(), self.ax.get_ylim())
+        xent = self.xdata_dict[self.xdatacbb.get()]
+        if xent != self.xent:
+            self.set_xformat(xent)
+            self.xent = xent
+            full_draw = True
+        ykind, ylabel = YDATA[self.ydatacbb.get()]
+        if self.ydatacbb.get() != self.ychoice:
+            self.ax.set_ylabel(ylabel)
+            self.ychoice = self.ydatacbb.get()
+            full_draw = True
+        xdata = {}
+        names = {name for (name, i), label in self.ydatadict.items() if label.value}
+        for name in names.intersection(self.model.sources):
+            window = self.model.sources[name][0]
+            if xent == 0:
+                tempx = window.index
+                xnum = window.xnum
+            elif xent in window.columns:
+                tempx = xnum = window.columns[xent]
+            else:
+                continue
+            xdata[name] = (tempx, xnum, bool(np.all(np.diff(xnum) >= 0)))
+        shown = set(self.data_dict)
+        self.data_dict = {}
+        for key, label in self.ydatadict.items():
+            name, i = key
+            ycol = i if ykind is None else (i, ykind)
+            if label.value and name in xdata and ycol in self.model.sources[name][0].columns:
+                tempx, xnum, xsorted = xdata[name]
+                tempy = self.model.sources[name][0].columns[ycol]
+                self.data_dict[key] = (tempx, xnum, xsorted, tempy, ycol)
+                self.line_dict[key].set_data(tempx, tempy)
+        for key in shown.symmetric_difference(self.data_dict):
+            self.line_dict[key].set_visible(key in self.data_dict)
+            full_draw = True
+        # only new data for these channels redraws the frame, a channel
+        # that is not read yet is read because it is subscribed to
+        wanted = [(name, i if ykind is None else (i, ykind))
+                  for (name, i), label in self.ydatadict.items() if label.value]
+        self.model.subscribe(self.on_change, wanted + [(name, xent) for name, i in wanted])
+        self.ax.relim(visible_only=True)
+        if self.lockxvar.get():
+            self.ax.autoscale(axis="x")
+        if self.lockyvar.get():
+            self.ax.autoscale(axis="y")
+        self.decimate_lines()
+        if full_draw or limits != (self.ax.get_xlim(), self.ax.get_ylim()):
+            self.canvas.draw()
+            self.navtoolbar.update()
+        else:
+            self.canvas.restore_region(self.background)
+            self.draw_lines()
+
+    def set_xformat(self, xent):
+        if xent == 0:
+            # use datetime format on x axis, a locator per axis as it keeps the axis it is set on
+            locator = mdates.AutoDateLocator(minticks=3, maxticks=7)
+            self.ax.xaxis.set_major_locator(locator)
+            self.ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+            self.ax.set_xlabel('Time')
+        elif xent == 1:
+            # use scalar format on x axis
+            self.ax.xaxis.set_major_locator(AutoLocator())
+            self.ax.xaxis.set_major_formatter(ScalarFormatter())
+            self.ax.set_xlabel('Time [s]')
+        else:
+            # use scalar format on x axis
+            self.ax.xaxis.set_major_locator(AutoLocator())
+            self.ax.xaxis.set_major_formatter(ScalarFormatter())
+            self.ax.set_xlabel('Temperature (mK)')
+
+    def decimate_lines(self, ax=None):
+        # Limits are computed on the full data, afterwards every visible line
+        # only keeps the min and max per pixel of the visible x range. Also
+        # called when the x limits change by zooming or panning. Against time,
+        # wide ranges come from the pyramid level that fits the pixel width.
+        if not self.data_dict:
+            return
+        xmin, xmax = sorted(self.ax.get_xlim())
+        buckets = max(int(self.ax.bbox.width), 1)
+        for (name, i), (tempx, xnum, xsorted, tempy, ycol) in self.data_dict.items():
+            if not xsorted:
+                continue
+            line = self.line_dict[(name, i)]
+            pyramid = self.model.sources[name][1].get(ycol)
+            levels = pyramid.query(xmin, xmax, buckets) if pyramid and self.xent == 0 else None
+            if levels is not None:
+                x, y, covered = levels
+                first = np.searchsorted(xnum, covered, "right")
+                line.set_data(np.concatenate([x, xnum[first:]]), np.concatenate([y, tempy[first:]]))
+            else:
+                indices = minmax_indices(xnum, tempy, xmin, xmax, buckets)
+                line.set_data(tempx[indices], tempy[indices])
+
+    def on_draw(self, event):
+        # every full draw (also zoom and pan) renders everything except
+        # the animated lines, which is exactly the background to blit on
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self.draw_lines()
+
+    def draw_lines(self):
+        for line in self.line_dict.values():
+            self.ax.draw_artist(line)
+        self.canvas.blit(self.fig.bbox)
+
+    def on_change(self, changes):
+        # changes: channel -> rows, only for the channels this frame shows
+        self.plotupdate()
+
+    def change_name(self, name):
+        self.name.set(name)
+
+    def remove_window(self):
+        self.model.unsubscribe(self.on_change)
+        self.destroy() 
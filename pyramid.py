@@ -0,0 +1,165 @@
+import numpy as np
+
+
+BASE_SIZE = 16  # rows per bucket in the finest level
+FACTOR = 4      # buckets of one level per bucket of the next level
+FIELDS = ("first", "last", "min", "max", "mean")
+
+
+def aggregate(fields, size):
+    # combine every `size` consecutive buckets, what is left over is returned as well
+    complete = len(fields["min"]) // size * size
+    groups = {name: array[:complete].reshape(-1, size) for name, array in fields.items()}
+    aggregated = {"first": groups["first"][:, 0],
+                  "last": groups["last"][:, -1],
+                  "min": np.fmin.reduce(groups["min"], axis=1),
+                  "max": np.fmax.reduce(groups["max"], axis=1),
+                  "mean": groups["mean"].mean(axis=1)}
+    rest = {name: array[complete:] for name, array in fields.items()}
+    return aggregated, rest
+
+
+class Level():
+    """
+    One level of the pyramid: for every bucket the x of
+    its first and last row and the min, max and mean of y.
+    The arrays grow by doubling, so appending is cheap and
+    views of the filled part stay valid for the reader.
+    """
+    def __init__(self, rows):
+        self.rows = rows
+        self.count = 0
+        self.arrays = {name: np.empty(64) for name in FIELDS}
+        self.pending = {name: np.empty(0) for name in FIELDS}
+
+    def extend(self, fields):
+        n = len(fields["min"])
+        if self.count + n > len(self.arrays["min"]):
+            capacity = max(2*len(self.arrays["min"]), self.count + n)
+            for name, array in self.arrays.items():
+                grown = np.empty(capacity)
+                grown[:self.count] = array[:self.count]
+                self.arrays[name] = grown
+        for name, array in fields.items():
+            self.arrays[name][self.count:self.count + n] = array
+        self.count += n
+
+    def view(self):
+        return {name: array[:self.count] for name, array in self.arrays.items()}
+
+
+class Pyramid():
+    """
+    This class aggregates one channel into successively
+    coarser buckets (BASE_SIZE rows, then FACTOR times
+    more per level) holding min, max and mean. New rows
+    only touch the buckets they complete. Rows that do not
+    fill a bucket yet wait in the pending arrays.
+    """
+    def __init__(self):
+        self.levels = []
+        self.pending = {name: np.empty(0) for name in FIELDS}
+
+    def append(self, x, y):
+        fields = {"first": x, "last": x, "min": y, "max": y, "mean": y}
+        pending = self.pending
+        i = 0
+        while len(fields["min"]):
+            if i == len(self.levels):
+                if i and self.levels[-1].count < FACTOR:
+                    break
+                self.levels.append(Level(BASE_SIZE*FACTOR**i))
+                if i:
+                    # a new level starts from every bucket of the level below
+                    fields = self.levels[-2].view()
+            fields = {name: np.concatenate([pending[name], array]) for name, array in fields.items()}
+            complete, rest = aggregate(fields, BASE_SIZE if i == 0 else FACTOR)
+            if i == 0:
+                self.pending = rest
+            else:
+                self.levels[i-1].pending = rest
+            self.levels[i].extend(complete)
+            pending = self.levels[i].pending
+            fields = complete
+            i += 1
+
+    def snapshot(self):
+        # completed buckets never change, so the views can be read in another thread
+        return PyramidView([(level.rows, level.view()) for level in self.levels])
+
+
+class PyramidView():
+    """
+    Read only copy of a Pyramid, used by the plot frames.
+    """
+    def __init__(self, levels):
+        self.levels = levels
+
+    def query(self, xmin, xmax, budget, mean=False):
+        # Points of the finest level that has at most `budget` buckets between
+        # xmin and xmax, drawn as a vertical min-max segment per bucket, or
+        # with mean=True one point at the mean of each bucket. The
+        # buckets that are not aggregated yet come from the finer levels.
+        # Returns None when the finest level fits, then the raw data is cheap
+        # enough, otherwise x, y and the x up to which the levels cover the data.
+        chosen = None
+        for i, (rows, fields) in enumerate(self.levels):
+            start = max(np.searchsorted(fields["last"], xmin, "left") - 1, 0)
+            stop = min(np.searchsorted(fields["first"], xmax, "right") + 1, len(fields["first"]))
+            if stop - start <= budget:
+                chosen = i
+                break
+        if chosen == 0 or not self.levels:
+            return None
+        if chosen is None:
+            chosen = len(self.levels) - 1
+            fields = self.levels[chosen][1]
+            start, stop = 0, len(fields["first"])
+        parts = [(fields, start, stop)]
+        if stop < len(fields["first"]):
+            covered = np.inf
+        else:
+            covered = fields["last"][-1] if stop else -np.inf
+            for rows, finer in reversed(self.levels[:chosen]):
+                # the tail of a finer level is shorter than FACTOR buckets
+                start = np.searchsorted(finer["first"], covered, "right")
+                parts.append((finer, start, len(finer["first"])))
+                if start < len(finer["first"]):
+                    covered = finer["last"][-1]
+        x = []
+        y = []
+        for fields, start, stop in parts:
+            middle = (fields["first"][start:stop] + fields["last"][start:stop])/2
+            if mean:
+                x.append(middle)
+                y.append(fields["mean"][start:stop])
+            else:
+                x.append(np.repeat(middle, 2))
+                y.append(np.column_stack([fields["min"][start:stop], fields["max"][start:stop]]).ravel())
+        return np.concatenate(x), np.concatenate(y), covered
+
+
+class PyramidCache():
+    """
+    This class keeps a Pyramid per column for the converted
+    values, x are the date numbers of the rows. A pyramid
+    is extended with the rows appended since the last
+    update and rebuilt when the calibration changes or the
+    file is read again from scratch. When it reaches back
+    more than twice the window length it is rebuilt from
+    the window, so live monitoring does not grow it forever.
+    """
+    def __init__(self):
+        self.entries = {}
+
+    def update(self, column, conv, xnum, values, generation, start, stop):
+        # entries: (conv, generation, first row, last row, pyramid)
+        entry = self.entries.get(column)
+        if (entry is None or entry[:2] != (conv, generation) or not start <= entry[3] <= stop
+                or start - entry[2] > stop - start):
+            entry = (conv, generation, start, start, Pyramid())
+        first = entry[3] - start
+        if first < len(values):
+            entry[4].append(xnum[first:], values[first:])
+        self.entries[column] = (conv, generation, entry[2], stop, entry[4])
+        return entry[4].snapshot()
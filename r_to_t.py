@@ -294,5 +294,138 @@ def r_to_t(conv):
             }.get(conv, 0)
 
 
+# Array versions of the functions above. Every polynomial is stored as its
+# coefficients in log(r), lowest order first, and evaluated in Horner form.
+PT1000 = (15.96010078315383, -5.777265693615240, 1.719621878746819,
+          -0.3296896904176034, 0.0325135160361472, -0.001238253183442626)
+F_HIGH = (16.01256220008178, -24.81483636871209, 17.32085139761442,
+          -6.085430265212089, 1.173753050126549, -0.1183163650122031,
+          0.00491460677567561)
+F_LOW = (-710.0262877572307, 322.9179399161088, -58.45146855850959,
+         5.326453045978480, -0.2441816228296264, 0.00451395822170572)
+SP_HIGH = (42.32605191233305, -35.48617979865299, 15.6682358081070,
+           -3.820230536108149, 0.5234443687473452, -0.0380286996197814,
+           0.001147509051044717)
+G_HIGH = (29.58202363692958, -45.17177520349549, 29.88064676651070,
+          -10.13755050845119, 1.89407235107920, -0.1852372231339097,
+          0.00745225544312689)
+G_LOW = (-544.5676017482177, 248.1849769707541, -44.92493250442995,
+         4.100831010357989, -0.1885849850224576, 0.00350331131792698)
+H_HIGH = (37.63866172713826, -56.63260628198017, 36.44474795527592,
+          -12.09994511601816, 2.217744387707139, -0.2131888447891270,
+          0.00844030051139322)
+H_LOW = (-649.6607257566526, 294.5907063066699, -53.12596898007016,
+         4.825044411084273, -0.2205324289126790, 0.00406648820879758)
+N_HIGH = (73.41324970439078, -106.3311032542545, 63.82555719639306,
+          -19.92653500750758, 3.450043217733591, -0.3148258368795170,
+          0.01188214232583087)
+N_LOW = (-1977.61071503373, 858.8345018658966, -149.1881936568861,
+         13.01167076142443, -0.5697361944449233, 0.01003208556390609)
+L_HIGH = (104.6750874814212, -148.3086471863297, 86.47846539832611,
+          -26.30376527679790, 4.444252174117409, -0.3965138967120258,
+          0.01465514055121579)
+L_LOW = (-5.943338267631620, 6.244093734707140, -2.011598936020319,
+         0.3927201152433503, -0.0419866882804895, 0.002200681550971356)
+M_HIGH = (252.7479592137451, -335.5111793651910, 184.2587231397065,
+          -53.31965387121053, 8.607951369319844, -0.7358641617817465,
+          0.02607920087098386)
+M_LOW = (-1481.063886828427, 632.4460811462583, -108.2946175749663,
+         9.345244793972663, -0.4063608406993035, 0.00713527326482104)
+RF100_HIGH = (93.676905857752, -217.342944180393, 189.113889383055,
+              -81.142864499611, 18.635568586572, -2.201508223114,
+              0.105386314079)
+RF100_LOW = (-466.296008848081, 784.495465820407, -496.814648787330,
+             140.391660314194, -14.857438050347)
+AR3_POLY = (-16.985738592265, 20.869593118260, -9.403401237195,
+            2.210818028415, -0.260713605058, 0.012529791664)
+A8_POLY = (-34.124813158161, 38.543806856537, -16.635982614833,
+           3.672767013032, -0.406705361858, 0.018288321417)
+
+
+def horner(coefficients, x):
+    result = np.full_like(x, coefficients[-1])
+    for c in coefficients[-2::-1]:
+        result = result*x + c
+    return result
+
+
+def log_poly(coefficients, scale=1, shift=0, factor=1, offset=0):
+    # offset + factor*exp(P(log(scale*(r-shift))))
+    def kernel(r):
+        r = np.asarray(r, dtype=float)
+        return offset + factor*np.exp(horner(coefficients, np.log(scale*(r-shift))))
+    return kernel
+
+
+def piecewise(threshold, high, low):
+    # high(r) where r >= threshold, low(r) elsewhere
+    def kernel(r):
+        r = np.asarray(r, dtype=float)
+        out = np.empty_like(r)
+        mask = r >= threshold
+        out[mask] = high(r[mask])
+        out[~mask] = low(r[~mask])
+        return out
+    # the branches are needed by r_to_t_table and the inverse
+    kernel.threshold = threshold
+    kernel.high = high
+    kernel.low = low
+    return kernel
+
+
+def default_vec(r):
+    return np.asarray(r, dtype=float)
+
+
+def sp_low_vec(r):
+    return ((np.log(np.asarray(r, dtype=float))-6.58231)/28.60582)**(-1/0.4712)
+
+
+def MRDS_vec(r):
+    return 102073/(np.asarray(r, dtype=float)-5.38)
+
+
+fhigh_vec = log_poly(F_HIGH)
+flow_vec = log_poly(F_LOW, scale=1000, factor=1e-3)
+ghigh_vec = log_poly(G_HIGH)
+glow_vec = log_poly(G_LOW, scale=1000, factor=1e-3)
+hhigh_vec = log_poly(H_HIGH)
+hlow_vec = log_poly(H_LOW, scale=1000, factor=1e-3)
+nhigh_vec = log_poly(N_HIGH)
+nlow_vec = log_poly(N_LOW, scale=1000, factor=1e-3)
+
+r_to_t_vec_functions = {
+    0: default_vec,                                             # Default
+    1: log_poly(PT1000, offset=-280),                           # Pt1000 test
+    2: fhigh_vec,                                               # F  high
+    3: piecewise(7850, log_poly(SP_HIGH), sp_low_vec),          # SP special
+    4: flow_vec,                                                # F low
+    5: ghigh_vec,                                               # G high
+    6: glow_vec,                                                # G low
+    7: hhigh_vec,                                               # H high
+    8: hlow_vec,                                                # H low
+    9: nhigh_vec,                                               # N high
+    10: nlow_vec,                                               # N low
+    11: piecewise(199.8, fhigh_vec, flow_vec),                  # F high low
+    12: piecewise(204.7, ghigh_vec, glow_vec),                  # G high low
+    13: piecewise(212.79, hhigh_vec, hlow_vec),                 # H high low
+    14: piecewise(225.524, nhigh_vec, nlow_vec),                # N high low
+    15: piecewise(223.76, log_poly(L_HIGH),
+                  log_poly(L_LOW, shift=5.2)),                  # L high low
+    16: piecewise(234.19, log_poly(M_HIGH),
+                  log_poly(M_LOW, scale=1000, factor=1e-3)),    # M high low
+    17: piecewise(90, log_poly(RF100_HIGH, scale=0.1),
+                  log_poly(RF100_LOW, scale=0.1)),              # RF100 high low
+    18: MRDS_vec,                                               # MRDS
+    19: log_poly(AR3_POLY),                                     # AR3
+    20: log_poly(A8_POLY),                                      # a8
+    }
+
+
+def r_to_t_vec(conv):
+    # Same cases as r_to_t, but the returned function takes whole arrays
+    return r_to_t_vec_functions.get(conv, 0)
+
+
 if __name__ == "__main__":
     print("Just copy the function and use it in your code")
\ No newline at end of file
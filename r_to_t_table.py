@@ -0,0 +1,224 @@
+"""
+Interpolation tables for the calibrations in r_to_t.
+
+A calibration is sampled on knots evenly spaced in log(r) and stored as
+cubic Hermite segments, so a conversion is one log, a table lookup and a
+cubic instead of exp of a 5th or 6th order polynomial. For the high/low
+calibrations the threshold is a knot, segments on either side follow
+their own branch. Tables are built the first time a calibration is used
+and kept. Resistances outside the table (and nan) are converted with the
+closed form, so the result never depends on how far the table reaches.
+
+    python r_to_t_table.py
+
+prints the maximum relative error of every table against r_to_t_vec.
+"""
+import warnings
+
+import numpy as np
+
+from r_to_t import r_to_t_vec, r_to_t_vec_functions, r_to_t_dict
+
+
+R_MIN = 1e-1           # resistance range covered by the tables
+R_MAX = 1e7
+T_MIN = 1e-2           # |T| outside T_MIN..T_MAX is left to the closed form,
+T_MAX = 1e7            # the fits are steep and meaningless there
+SCAN_SIZE = 8192       # samples used to find the range of every piece
+START_SIZE = 1024      # knots of a new table, doubled until it is accurate
+MAX_SIZE = 1 << 18
+TOLERANCE = 1e-8       # maximum relative error of a table
+CLOSED_FORM = {0, 18}  # r itself and MRDS are cheaper than a lookup
+
+
+def pieces(kernel):
+    # (r_min, r_max, kernel) for every smooth piece of a calibration
+    threshold = getattr(kernel, "threshold", None)
+    if threshold is None:
+        return [(R_MIN, R_MAX, kernel)]
+    return [(R_MIN, threshold, kernel.low), (threshold, R_MAX, kernel.high)]
+
+
+def finite_range(kernel, r_min, r_max):
+    # longest run of the scan where the kernel gives usable values, as log(r)
+    u = np.linspace(np.log(r_min), np.log(r_max), SCAN_SIZE)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        t = kernel(np.exp(u))
+    usable = np.isfinite(t) & (np.abs(t) >= T_MIN) & (np.abs(t) <= T_MAX)
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], usable.astype(np.int8), [0]])))
+    if not len(edges):
+        return None
+    starts, stops = edges[::2], edges[1::2]
+    longest = np.argmax(stops - starts)
+    first, last = starts[longest], stops[longest] - 1
+    # ends at a threshold are kept exactly, the scan only limits the open ends
+    low = np.log(r_min) if first == 0 else u[first]
+    high = np.log(r_max) if last == SCAN_SIZE - 1 else u[last]
+    if high <= low:
+        return None
+    return low, high
+
+
+class TableCalibration():
+    """
+    Array conversion for one calibration through a table,
+    a drop-in replacement for r_to_t_vec(conv). Knot
+    self.split lies on the threshold: segments below it
+    interpolate the low branch, segments above the high
+    branch. The slopes at the knots come from a five point
+    difference of the closed form, so the error falls with
+    the fourth power of the knot distance. The number of
+    knots is doubled until the error measured halfway
+    between the knots is below TOLERANCE.
+    """
+    def __init__(self, conv):
+        self.conv = conv
+        self.closed_form = r_to_t_vec(conv)
+        self.threshold = getattr(self.closed_form, "threshold", None)
+        self.size = 0
+        self.max_error = 0.0
+        ranges = []
+        for r_min, r_max, kernel in pieces(self.closed_form):
+            limits = finite_range(kernel, r_min, r_max)
+            if limits is not None:
+                ranges.append(limits + (kernel,))
+        if not ranges:
+            return
+        split = None if self.threshold is None else np.log(self.threshold)
+        if len(ranges) == 2 and ranges[0][1] == split == ranges[1][0]:
+            self.kernels = (ranges[0][2], ranges[1][2])
+            self.low, self.high = ranges[0][0], ranges[1][1]
+        else:
+            low, high, kernel = max(ranges, key=lambda piece: piece[1] - piece[0])
+            if split is not None:
+                # a single branch, kept one knot distance clear of the threshold
+                margin = (high - low)/START_SIZE
+                low, high = (low + margin, high) if low == split else (low, high - margin)
+                split = None
+            self.kernels = (kernel, kernel)
+            self.low, self.high = low, high
+        step = (self.high - self.low)/START_SIZE
+        while True:
+            self.build(step, split)
+            if self.max_error <= TOLERANCE or self.size >= MAX_SIZE:
+                break
+            step /= 2
+
+    def build(self, step, split):
+        if split is None:
+            size = int(np.ceil((self.high - self.low)/step)) + 1
+            self.step = (self.high - self.low)/(size - 1)
+            self.split = size
+        else:
+            # the threshold is a knot, the top end is moved down onto a knot
+            self.split = max(int(np.ceil((split - self.low)/step)), 1)
+            self.step = (split - self.low)/self.split
+            size = self.split + int(np.floor((self.high - split)/self.step)) + 1
+            self.high = self.low + (size - 1)*self.step
+        self.size = size
+        u = self.low + self.step*np.arange(size)
+        below = np.arange(size - 1) < self.split
+        left = np.empty((2, size - 1))
+        right = np.empty((2, size - 1))
+        for kernel, mask in zip(self.kernels, (below, ~below)):
+            y, m = self.sample(kernel, u)
+            left[0, mask], left[1, mask] = y[:-1][mask], m[:-1][mask]
+            right[0, mask], right[1, mask] = y[1:][mask], m[1:][mask]
+        # per segment: value = ((c3*f + c2)*f + c1)*f + c0 with f in [0, 1]
+        self.c0 = left[0]
+        self.c1 = left[1]
+        self.c2 = 3*(right[0] - left[0]) - 2*left[1] - right[1]
+        self.c3 = 2*(left[0] - right[0]) + left[1] + right[1]
+        self.max_error = self.relative_error(self.test_points())
+
+    def sample(self, kernel, u):
+        # values and slopes (times the knot distance) at the knots
+        d = self.step/4
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            y = kernel(np.exp(u))
+            slope = (kernel(np.exp(u - 2*d)) - 8*kernel(np.exp(u - d))
+                     + 8*kernel(np.exp(u + d)) - kernel(np.exp(u + 2*d)))/(12*d)
+        return y, slope*self.step
+
+    def test_points(self):
+        # halfway between the knots (worst case for the cubic), on the knots and around the ends
+        u = self.low + self.step*np.arange(0, self.size - 1, 0.5)
+        edges = [np.exp(self.low), np.exp(self.high)]
+        if self.split < self.size:
+            edges.append(self.threshold)
+        nearby = np.outer(edges, 1 + np.array([0, 1e-12, -1e-12, 1e-9, -1e-9, 1e-6, -1e-6])).ravel()
+        return np.concatenate([np.exp(u), nearby])
+
+    def relative_error(self, r):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            exact = self.closed_form(r)
+            error = np.abs(self(r) - exact)/np.abs(exact)
+        return float(np.nanmax(error, initial=0))
+
+    def __call__(self, r):
+        r = np.asarray(r, dtype=float)
+        if not self.size:
+            return self.closed_form(r)
+        if r.ndim == 0:
+            return self(r[None])[0]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = np.log(r)
+            t -= self.low
+            t *= 1/self.step
+            i = t.astype(np.intp)
+        np.clip(i, 0, self.size - 2, out=i)
+        if self.split < self.size:
+            # log(r) can round onto the other side of the threshold knot
+            high = r >= self.threshold
+            wrong = high != (i >= self.split)
+            if wrong.any():
+                i[wrong] = np.where(high[wrong], self.split, self.split - 1)
+        f = t - i
+        out = np.take(self.c3, i)
+        out *= f
+        out += np.take(self.c2, i)
+        out *= f
+        out += np.take(self.c1, i)
+        out *= f
+        out += np.take(self.c0, i)
+        # everything outside the table (also nan) comes from the closed form
+        if t.size and not (t.min() >= 0 and t.max() <= self.size - 1):
+            outside = ~((t >= 0) & (t <= self.size - 1))
+            out[outside] = self.closed_form(r[outside])
+        return out
+
+
+tables = {}
+
+
+def r_to_t_table(conv):
+    # Same cases as r_to_t_vec, built on first use and cached
+    if conv in CLOSED_FORM or conv not in r_to_t_vec_functions:
+        return r_to_t_vec(conv)
+    if conv not in tables:
+        tables[conv] = TableCalibration(conv)
+    return tables[conv]
+
+
+def report():
+    # maximum relative error per calibration, the points around the thresholds included
+    names = {conv: name for name, conv in r_to_t_dict.items()}
+    for conv in r_to_t_vec_functions:
+        if conv in CLOSED_FORM:
+            continue
+        calibration = r_to_t_table(conv)
+        line = (f"{conv:>3} {names.get(conv, ''):<9} max rel. error {calibration.max_error:.2e}"
+                f"  r {np.exp(calibration.low):.4g} to {np.exp(calibration.high):.4g}, {calibration.size} knots")
+        if calibration.threshold is not None:
+            r = calibration.threshold*(1 + np.array([-1e-6, -1e-12, 0, 1e-12, 1e-6]))
+            exact = calibration.closed_form(r)
+            error = np.max(np.abs(calibration(r) - exact)/np.abs(exact))
+            line += f", at {calibration.threshold:g}: {error:.2e}"
+        print(line)
+
+
+if __name__ == "__main__":
+    report()
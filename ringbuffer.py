@@ -0,0 +1,79 @@
+import numpy as np
+
+
+MIN_SIZE = 64  # rows allocated for a growing buffer
+
+
+class RingBuffer():
+    """
+    This class keeps the last `capacity` rows of a set of
+    columns in arrays allocated once, three times that
+    long. Rows are written in place after the last row,
+    when the end is reached the rows still in the window
+    are moved to the front. The window is therefore always one
+    contiguous slice and view returns it without copying.
+    A view stays valid until `capacity` more rows have been
+    appended, so another thread can keep drawing it while
+    the next rows come in. With capacity None no rows are
+    dropped and the arrays grow by doubling.
+    """
+    def __init__(self, capacity, dtypes, size=0):
+        self.capacity = capacity
+        length = 3*capacity if capacity is not None else max(2*size, MIN_SIZE)
+        self.arrays = {name: np.empty(length, dtype) for name, dtype in dtypes.items()}
+        self.length = length
+        self.start = 0
+        self.stop = 0
+        self.total = 0  # rows appended since the start, also the dropped ones
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def append(self, columns):
+        # columns: name -> array of the new rows, columns that are left out
+        # are filled with nan (to be written afterwards through a view)
+        m = len(next(iter(columns.values()))) if columns else 0
+        if self.capacity is not None and m > self.capacity:
+            # only the last rows fit
+            drop = m - self.capacity
+            columns = {name: array[drop:] for name, array in columns.items()}
+            self.total += drop
+            m = self.capacity
+        if m == 0:
+            return
+        if self.stop + m > self.length:
+            if self.capacity is None:
+                self.grow(max(2*self.length, len(self) + m))
+            else:
+                keep = min(len(self), self.capacity - m)
+                for array in self.arrays.values():
+                    array[:keep] = array[self.stop - keep:self.stop]
+                self.start, self.stop = 0, keep
+        for name, array in self.arrays.items():
+            array[self.stop:self.stop + m] = columns.get(name, np.nan)
+        self.stop += m
+        self.total += m
+        if self.capacity is not None:
+            self.start = max(self.start, self.stop - self.capacity)
+
+    def grow(self, length):
+        # new arrays, views of the old ones stay as they are
+        for name, array in self.arrays.items():
+            grown = np.empty(length, array.dtype)
+            grown[:len(self)] = array[self.start:self.stop]
+            self.arrays[name] = grown
+        self.start, self.stop = 0, len(self)
+        self.length = length
+
+    def view(self, name):
+        return self.arrays[name][self.start:self.stop]
+
+    def drop(self, name):
+        self.arrays.pop(name, None)
+
+    def replace(self, name, values):
+        # new values for the whole window of one column (also a new column),
+        # in a new array so views handed out before keep the old values
+        array = np.empty(self.length, self.arrays[name].dtype if name in self.arrays else float)
+        array[self.start:self.stop] = values
+        self.arrays[name] = array
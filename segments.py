@@ -0,0 +1,256 @@
+"""
+Reading compressed .dat files and runs split into segments as one file.
+
+A path of a source is a .dat file or a tuple of segments, oldest first
+(see order_segments), each of them plain or compressed (.gz, .bz2, .xz).
+open_dat returns a binary file object over the uncompressed bytes of all
+segments one after the other and stat_dat their total size, so everything
+that reads a .dat file (read_tail_lines, TailReader, SidecarCache) works on
+them unchanged. Only the last segment is expected to grow.
+
+Compressed segments can not be read from an arbitrary position, the
+decompressor has to start at the beginning. While a gzip segment is
+decompressed a copy of the decompressor is kept every SPAN bytes of
+output; a read starts from the nearest copy before it, so reading the
+tail or any other part of the segment decompresses about that part only.
+The copies are made the first time the segment is read to its end (to
+know its size) and kept as long as the file does not change. bz2 and xz
+decompressors can not be copied, those segments are read from the start,
+or from where the previous read stopped. Of what is decompressed only the
+last SPAN bytes up to the end of the read are kept, whatever the format,
+so the tail blocks read_tail_lines asks for next are there already and a
+large archive is not held in memory. forget_segments drops those of a path
+that is no longer shown.
+"""
+import bz2
+import io
+import lzma
+import os
+import threading
+import zlib
+from bisect import bisect_right
+from collections import namedtuple
+
+
+SPAN = 1 << 20         # uncompressed bytes between two copies of a decompressor
+CHUNK_SIZE = 1 << 16   # compressed bytes fed at once
+HEAD_SIZE = 4096       # bytes searched for the first timestamp of a segment
+DECOMPRESSORS = {".gz": lambda: zlib.decompressobj(zlib.MAX_WBITS | 32),
+                 ".bz2": bz2.BZ2Decompressor,
+                 ".xz": lzma.LZMADecompressor}
+
+SegmentStat = namedtuple("SegmentStat", ["st_ino", "st_size", "st_mtime_ns"])
+
+
+def segment_paths(path):
+    return list(path) if isinstance(path, (tuple, list)) else [path]
+
+
+def is_compressed(path):
+    return os.path.splitext(path)[1] in DECOMPRESSORS
+
+
+def base_name(path):
+    # name of the newest segment without the compression and .dat extensions
+    name = os.path.basename(segment_paths(path)[-1])
+    if is_compressed(name):
+        name = os.path.splitext(name)[0]
+    return os.path.splitext(name)[0]
+
+
+class CompressedSegment():
+    """
+    Random access to the uncompressed bytes of one
+    compressed file. checkpoints holds (position, offset
+    in the compressed file, decompressor) from position 0
+    on, the decompressors are never used themselves, only
+    copies of them. The last SPAN bytes up to the end of
+    the last read are kept, so the blocks read_tail_lines
+    asks for one by one are decompressed only once.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.new = DECOMPRESSORS[os.path.splitext(path)[1]]
+        self.copyable = hasattr(self.new(), "copy")
+        self.checkpoints = [(0, 0, self.new())]
+        self.stream = None  # where the previous read stopped, used without copying
+        self.cache = (0, b"")
+        self.size = None
+        self.lock = threading.Lock()
+
+    def length(self):
+        with self.lock:
+            if self.size is None:
+                self.decode(float("inf"), keep=False)
+            return self.size
+
+    def read(self, position, size):
+        with self.lock:
+            if self.size is not None and position >= self.size:
+                return b""
+            start, data = self.cache
+            if not start <= position or position + size > start + len(data):
+                start, data = self.decode(position + size, position)
+                self.cache = (start, data)
+            return data[position - start:position - start + size]
+
+    def decode(self, stop, position=None, keep=True):
+        # decompresses from the last state before position (the furthest
+        # one for None) until stop, returns (start, bytes) of the output
+        # from position on, or from SPAN bytes before stop if that is earlier
+        target = float("inf") if position is None else position
+        i = bisect_right([state[0] for state in self.checkpoints], target) - 1
+        pos, offset, decompressor = self.checkpoints[i]
+        if self.stream is not None and pos <= self.stream[0] <= target:
+            pos, offset, decompressor = self.stream
+        elif self.copyable:
+            decompressor = decompressor.copy()
+        else:
+            # bz2 and xz: the only checkpoint is the start
+            decompressor = self.new()
+        start = max(pos, min(target, stop - SPAN))
+        output = []
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            while pos < stop:
+                if self.copyable and pos >= self.checkpoints[-1][0] + SPAN:
+                    self.checkpoints.append((pos, offset, decompressor.copy()))
+                data = f.read(CHUNK_SIZE)
+                if not data:
+                    self.size = pos
+                    break
+                offset += len(data)
+                while data:
+                    if decompressor.eof:
+                        # the next member (gzip) or stream, zeros padding the end are skipped
+                        if not data.strip(b"\0"):
+                            break
+                        decompressor = self.new()
+                    out = decompressor.decompress(data)
+                    data = decompressor.unused_data if decompressor.eof else b""
+                    if keep and pos + len(out) > start:
+                        output.append(out[max(start - pos, 0):])
+                    pos += len(out)
+        self.stream = (pos, offset, decompressor)
+        return start, b"".join(output)
+
+
+segments = {}
+segments_lock = threading.Lock()
+
+
+def compressed_segment(path):
+    # one CompressedSegment per file, made again when the file changes
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with segments_lock:
+        if key not in segments:
+            for old in [old for old in segments if old[0] == key[0]]:
+                segments.pop(old)
+            segments[key] = CompressedSegment(path)
+        return segments[key]
+
+
+def forget_segments(path):
+    # drops the CompressedSegments of the segments of a path, with what they keep in memory
+    names = {os.path.abspath(p) for p in segment_paths(path) if is_compressed(p)}
+    with segments_lock:
+        for key in [key for key in segments if key[0] in names]:
+            segments.pop(key)
+
+
+class SegmentedFile(io.RawIOBase):
+    """
+    The segments of a path as one binary file. Sizes are
+    taken when the file is opened, only the last segment
+    (if it is not compressed) can be read beyond that, as
+    far as it has grown since.
+    """
+    def __init__(self, paths):
+        super().__init__()
+        self.parts = []  # (start, size, file or CompressedSegment)
+        self.position = 0
+        start = 0
+        for path in paths:
+            if is_compressed(path):
+                part = compressed_segment(path)
+                size = part.length()
+            else:
+                part = open(path, 'rb')
+                size = os.fstat(part.fileno()).st_size
+            self.parts.append((start, size, part))
+            start += size
+        self.size = start
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        elif whence == os.SEEK_END:
+            offset += self.size
+        self.position = max(offset, 0)
+        return self.position
+
+    def readinto(self, buffer):
+        # from the one segment the position is in, the BufferedReader of open_dat asks again for the rest
+        for i, (start, size, part) in enumerate(self.parts):
+            growing = i == len(self.parts) - 1 and not isinstance(part, CompressedSegment)
+            if self.position < start + size or growing:
+                break
+        else:
+            return 0
+        count = len(buffer) if growing else min(len(buffer), start + size - self.position)
+        if isinstance(part, CompressedSegment):
+            data = part.read(self.position - start, count)
+        else:
+            part.seek(self.position - start)
+            data = part.read(count)
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+    def close(self):
+        for start, size, part in self.parts:
+            if not isinstance(part, CompressedSegment):
+                part.close()
+        super().close()
+
+
+def open_dat(path):
+    # binary file object of the uncompressed bytes of all segments
+    paths = segment_paths(path)
+    if len(paths) == 1 and not is_compressed(paths[0]):
+        return open(paths[0], 'rb')
+    return io.BufferedReader(SegmentedFile(paths))
+
+
+def stat_dat(path):
+    # inode of the last segment, which is the one that grows, and the size of all segments
+    paths = segment_paths(path)
+    if len(paths) == 1 and not is_compressed(paths[0]):
+        return os.stat(paths[0])
+    stat = os.stat(paths[-1])
+    size = sum(compressed_segment(p).length() if is_compressed(p) else os.stat(p).st_size for p in paths)
+    return SegmentStat(stat.st_ino, size, stat.st_mtime_ns)
+
+
+def first_timestamp(path):
+    with open_dat(path) as f:
+        for line in f.read(HEAD_SIZE).split(b"\n"):
+            field = line.split(b"\t", 1)[0].strip()
+            if field and b"#" not in field:
+                return field
+    return b""
+
+
+def order_segments(paths):
+    # segments chosen together, oldest first; the timestamps have a fixed layout and sort as text
+    return tuple(sorted(paths, key=lambda path: (first_timestamp(path), path)))
@@ -0,0 +1,162 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from dat_reader import lines_to_dataframe
+from segments import open_dat, stat_dat, segment_paths
+from timing import timer
+
+
+CHUNK_SIZE = 1 << 24
+HEAD_SIZE = 256
+
+
+class SidecarCache():
+    """
+    This class keeps a binary copy of a .dat file in a
+    directory next to it (file.dat.cache). The timestamps
+    (int64 nanoseconds) and every column (float64) are
+    stored as one contiguous array per file, so they can
+    be opened with np.memmap without parsing. meta.json
+    records how many rows are stored and up to which byte
+    of the .dat file they were parsed, so the cache is
+    extended with the new lines only. When the .dat file
+    is replaced or truncated the cache is rebuilt. For
+    segments (see segments.py) the cache is next to the
+    newest one.
+    """
+    def __init__(self, path_to_file):
+        self.path_to_file = path_to_file
+        self.directory = segment_paths(path_to_file)[-1] + ".cache"
+        self.meta = None
+
+    @property
+    def rows(self):
+        return self.meta["rows"]
+
+    @property
+    def offset(self):
+        return self.meta["offset"]
+
+    def column_path(self, name):
+        return os.path.join(self.directory, f"{name}.bin")
+
+    def read_head(self):
+        with open_dat(self.path_to_file) as f:
+            return f.read(HEAD_SIZE).decode("latin-1")
+
+    def load_meta(self):
+        try:
+            with open(os.path.join(self.directory, "meta.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_meta(self):
+        path = os.path.join(self.directory, "meta.json")
+        with open(path + ".tmp", 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(path + ".tmp", path)
+
+    def is_valid(self, meta, stat):
+        if meta is None or meta.get("inode") != stat.st_ino or meta.get("offset", 0) > stat.st_size:
+            return False
+        head = self.read_head()
+        stored = meta.get("head", "")
+        return head[:len(stored)] == stored[:len(head)]
+
+    def clear(self, stat):
+        os.makedirs(self.directory, exist_ok=True)
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+        self.meta = {"inode": stat.st_ino, "head": "", "offset": 0, "rows": 0, "columns": None}
+        self.save_meta()
+
+    def update(self):
+        # parse everything that was appended to the .dat file since the last update
+        stat = stat_dat(self.path_to_file)
+        meta = self.load_meta()
+        if not self.is_valid(meta, stat):
+            self.clear(stat)
+        else:
+            self.meta = meta
+            self.truncate()
+        if len(self.meta["head"]) < HEAD_SIZE:
+            self.meta["head"] = self.read_head()
+        with open_dat(self.path_to_file) as f:
+            f.seek(self.offset)
+            buffer = b""
+            while True:
+                with timer.stage("io"):
+                    data = f.read(CHUNK_SIZE)
+                if not data:
+                    break
+                buffer += data
+                end = buffer.rfind(b"\n") + 1
+                if end:
+                    df = lines_to_dataframe(buffer[:end].decode().splitlines())
+                    self.write(df, self.offset + end)
+                    buffer = buffer[end:]
+
+    def truncate(self):
+        # drop rows that were written without updating meta.json (e.g. a crash)
+        for name in ["index"] + (self.meta["columns"] or []):
+            path = self.column_path(name)
+            if os.path.exists(path) and os.path.getsize(path) > 8*self.rows:
+                os.truncate(path, 8*self.rows)
+
+    def append(self, df, start_offset, end_offset):
+        # rows parsed elsewhere (TailReader), only valid if they follow on the cache
+        if self.meta is None or start_offset != self.offset:
+            self.update()
+            return False
+        self.write(df, end_offset)
+        return True
+
+    def write(self, df, end_offset):
+        if not df.empty:
+            columns = [str(col) for col in df.columns]
+            if self.meta["columns"] is None:
+                self.meta["columns"] = columns
+            elif columns != self.meta["columns"]:
+                raise ValueError(f"{self.path_to_file} changed its number of columns")
+            arrays = {"index": df.index.as_unit("ns").asi8.astype("<i8")}
+            for col, name in zip(df.columns, columns):
+                arrays[name] = df[col].to_numpy(dtype="<f8")
+            for name, array in arrays.items():
+                with open(self.column_path(name), 'ab') as f:
+                    f.write(array.tobytes())
+            self.meta["rows"] += len(df)
+        self.meta["offset"] = end_offset
+        self.save_meta()
+
+    def open(self):
+        # memory mapped arrays of all rows, nothing is read into memory yet
+        arrays = {}
+        for name in ["index"] + (self.meta["columns"] or []):
+            if self.rows:
+                arrays[name] = np.memmap(self.column_path(name), dtype="<f8", mode="r", shape=(self.rows,))
+            else:
+                arrays[name] = np.empty(0, dtype="<f8")
+        if "index" in arrays:
+            arrays["index"] = arrays["index"].view("<i8").view("datetime64[ns]")
+        return arrays
+
+    def between(self, start, stop=None):
+        # rows (first, last + 1) from time start to stop (None: the newest row)
+        index = self.open().get("index", np.empty(0, "datetime64[ns]"))
+        first = np.searchsorted(index, np.datetime64(start, "ns"), "left")
+        last = len(index) if stop is None else np.searchsorted(index, np.datetime64(stop, "ns"), "right")
+        return int(first), int(max(last, first))
+
+    def dataframe(self, start, stop, columns=None):
+        # columns: the column numbers to include, None for all
+        arrays = self.open()
+        if not self.meta["columns"]:
+            return pd.DataFrame()
+        index = pd.DatetimeIndex(arrays.pop("index")[start:stop])
+        return pd.DataFrame({int(name): array[start:stop] for name, array in arrays.items()
+                             if columns is None or int(name) in columns},
+                            index=index, copy=False)
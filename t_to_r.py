@@ -0,0 +1,159 @@
+"""
+Inverse of the calibrations in r_to_t: the resistance for a temperature.
+
+    r = t_to_r_vec(r_to_t_dict["N"])(temperatures)
+
+Every branch of a calibration is scanned once on an even grid in log(r)
+to find where it is monotonic, a temperature is then bracketed between
+two grid points of the branch that reaches it and solved in log(r) with
+Newton steps, falling back to bisection whenever a step leaves the
+bracket. After NEWTON_STEPS iterations only bisection is used, so every
+value converges within MAX_STEPS iterations. For the high/low
+calibrations a temperature reached by both branches gets the high
+branch resistance, the result always lies on the side of the threshold
+whose branch produced it. Temperatures that no resistance gives are nan.
+"""
+import warnings
+
+import numpy as np
+
+from r_to_t import r_to_t_vec, r_to_t_vec_functions, r_to_t_dict
+from r_to_t_table import pieces, T_MIN, T_MAX, SCAN_SIZE
+
+
+NEWTON_STEPS = 20
+MAX_STEPS = NEWTON_STEPS + 64  # 64 halvings bring any bracket of the scan below the float spacing
+U_TOLERANCE = 1e-13            # relative tolerance on r
+DERIVATIVE_STEP = 1e-6         # in log(r)
+ROUNDING = 1e-12
+
+
+def evaluate(kernel, u):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        return kernel(np.exp(u))
+
+
+def monotonic_scan(kernel, r_min, r_max):
+    # grid points (log(r), T) of the longest usable run where T is strictly monotonic
+    u = np.linspace(np.log(r_min), np.log(r_max), SCAN_SIZE)
+    t = evaluate(kernel, u)
+    usable = np.isfinite(t) & (np.abs(t) >= T_MIN) & (np.abs(t) <= T_MAX)
+    with np.errstate(invalid="ignore"):
+        direction = np.sign(np.diff(t))
+    # a step belongs to a run when both ends are usable and it goes the same way as the previous step
+    good = usable[:-1] & usable[1:] & (direction != 0)
+    best = None
+    start = None
+    for i in range(len(good) + 1):
+        same = i < len(good) and good[i] and (start is None or direction[i] == direction[start])
+        if start is not None and not same:
+            if best is None or i - start > best[1] - best[0]:
+                best = (start, i)
+            start = None
+        if start is None and i < len(good) and good[i]:
+            start = i
+    if best is None:
+        return None
+    first, last = best
+    return u[first:last + 1], t[first:last + 1]
+
+
+class InverseCalibration():
+    """
+    Batched inverse of one calibration, the counterpart of
+    r_to_t_vec(conv). Branches are tried from the high one
+    down, a temperature is solved in the first branch
+    whose monotonic range contains it.
+    """
+    def __init__(self, conv):
+        self.conv = conv
+        self.forward = r_to_t_vec(conv)
+        self.threshold = getattr(self.forward, "threshold", None)
+        self.branches = []
+        for r_min, r_max, kernel in reversed(pieces(self.forward)):
+            scan = monotonic_scan(kernel, r_min, r_max)
+            if scan is None:
+                continue
+            u, t = scan
+            if t[-1] < t[0]:
+                u, t = u[::-1], t[::-1]
+            self.branches.append((kernel, u, t, r_max == self.threshold))
+
+    def __call__(self, t):
+        t = np.asarray(t, dtype=float)
+        if t.ndim == 0:
+            return self(t[None])[0]
+        r = np.full_like(t, np.nan)
+        unsolved = np.isfinite(t)
+        for kernel, u, ts, below in self.branches:
+            # the ends of the scan are included up to rounding
+            mask = unsolved & (t >= ts[0] - ROUNDING*abs(ts[0])) & (t <= ts[-1] + ROUNDING*abs(ts[-1]))
+            if mask.any():
+                r[mask] = np.exp(solve(kernel, u, ts, t[mask]))
+                if below:
+                    # r == threshold would already be converted with the high branch
+                    r[mask] = np.minimum(r[mask], np.nextafter(self.threshold, 0))
+                elif self.threshold is not None:
+                    # exp(log(threshold)) can round to just below it
+                    r[mask] = np.maximum(r[mask], self.threshold)
+                unsolved &= ~mask
+        return r
+
+
+def solve(kernel, u, ts, targets):
+    # log(r) with kernel(r) == targets, ts is increasing along the grid u
+    k = np.clip(np.searchsorted(ts, targets), 1, len(ts) - 1)
+    low, high = u[k - 1], u[k]  # kernel(low) <= target <= kernel(high)
+    x = np.interp(targets, ts, u)
+    active = np.arange(len(targets))
+    for step in range(MAX_STEPS):
+        xa, target = x[active], targets[active]
+        g = evaluate(kernel, xa) - target
+        below = g < 0
+        low[active] = np.where(below, xa, low[active])
+        high[active] = np.where(below, high[active], xa)
+        la, ha = low[active], high[active]
+        middle = (la + ha)/2
+        if step < NEWTON_STEPS:
+            slope = (evaluate(kernel, xa + DERIVATIVE_STEP) - evaluate(kernel, xa - DERIVATIVE_STEP))/(2*DERIVATIVE_STEP)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                newton = xa - g/slope
+            inside = (newton > np.minimum(la, ha)) & (newton < np.maximum(la, ha))
+            new = np.where(inside, newton, middle)
+        else:
+            new = middle
+        exact = g == 0
+        x[active] = np.where(exact, xa, new)
+        done = exact | (np.abs(new - xa) <= U_TOLERANCE) | (np.abs(ha - la) <= U_TOLERANCE)
+        active = active[~done]
+        if not len(active):
+            break
+    return x
+
+
+inverses = {}
+
+
+def t_to_r_vec(conv):
+    # Same cases as r_to_t_vec, the returned function takes arrays of temperatures
+    if conv not in r_to_t_vec_functions or conv == 0:
+        return r_to_t_vec(0)
+    if conv == 18:
+        # MRDS: T = 102073/(r - 5.38)
+        return lambda t: 102073/np.asarray(t, dtype=float) + 5.38
+    if conv not in inverses:
+        inverses[conv] = InverseCalibration(conv)
+    return inverses[conv]
+
+
+if __name__ == "__main__":
+    # temperatures over the range of every branch, converted back and forth
+    names = {conv: name for name, conv in r_to_t_dict.items()}
+    for conv in r_to_t_vec_functions:
+        inverse = t_to_r_vec(conv)
+        for kernel, u, ts, below in getattr(inverse, "branches", []):
+            t = np.linspace(ts[0], ts[-1], 10000)
+            r = inverse(t)
+            error = np.max(np.abs(r_to_t_vec(conv)(r) - t)/np.abs(t))
+            print(f"{conv:>3} {names.get(conv, ''):<9} T {ts[0]:.4g} to {ts[-1]:.4g}: max rel. error {error:.1e}")
@@ -0,0 +1,150 @@
+"""
+Sparse index of the timestamps in a .dat file, for reading a time range
+without parsing the rest of the file.
+
+Every STRIDE bytes the first data line starting at or after that byte is
+looked up and its timestamp stored together with its offset. Only a few
+kB are read per entry, so the index of a large file is built quickly and
+extended with the new part when the file grows. It is kept next to the file
+(file.dat.index, json) as long as the file keeps its inode and first bytes;
+where the directory is read-only (an archive) it goes to USER_CACHE, and
+if that can not be written either it is only kept in memory.
+The timestamps of a .dat file only go up, so the rows between two times
+lie between the last entry before the start and the first entry after the
+end: a range costs its own lines plus at most two strides, wherever it
+is in the file.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from dat_reader import lines_to_dataframe, parse_timestamps, is_data_line, select_span
+from segments import open_dat, stat_dat, segment_paths
+
+
+STRIDE = 1 << 16    # bytes between two entries
+PROBE_SIZE = 4096   # bytes read to find the line of an entry
+HEAD_SIZE = 256
+SECONDS = len("0000-00-00 00:00:00")
+USER_CACHE = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+                          "plot_temperature_wim")
+
+
+class TimeIndex():
+    """
+    This class keeps the index of one .dat file (or
+    segments, see segments.py). meta holds the inode and
+    first bytes of the file, how far it has been indexed
+    (scanned) and the entries: offsets and timestamps in
+    int64 nanoseconds.
+    """
+    def __init__(self, path_to_file):
+        self.path_to_file = path_to_file
+        last = segment_paths(path_to_file)[-1]
+        # next to the file, else in the user cache under a name unique to the file
+        digest = hashlib.sha1(os.path.abspath(last).encode()).hexdigest()[:16]
+        self.paths = [last + ".index",
+                      os.path.join(USER_CACHE, f"{os.path.basename(last)}-{digest}.index")]
+        self.meta = None
+
+    def read_head(self):
+        with open_dat(self.path_to_file) as f:
+            return f.read(HEAD_SIZE).decode("latin-1")
+
+    def load(self):
+        # the stored indexes, the one next to the file first
+        for path in self.paths:
+            try:
+                with open(path) as f:
+                    yield json.load(f)
+            except (OSError, ValueError):
+                pass
+
+    def save(self):
+        for path in self.paths:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                with open(path + ".tmp", 'w') as f:
+                    json.dump(self.meta, f)
+                os.replace(path + ".tmp", path)
+                return
+            except OSError:
+                pass
+
+    def is_valid(self, meta, stat):
+        # scanned is where the next entry is looked for, it can be past the end
+        if meta is None or meta.get("inode") != stat.st_ino or (meta.get("offsets") or [0])[-1] > stat.st_size:
+            return False
+        head = self.read_head()
+        stored = meta.get("head", "")
+        return head[:len(stored)] == stored[:len(head)]
+
+    def update(self):
+        # adds the entries of the part of the file that was appended since the last update
+        stat = stat_dat(self.path_to_file)
+        if self.meta is None or not self.is_valid(self.meta, stat):
+            self.meta = next((meta for meta in self.load() if self.is_valid(meta, stat)), None)
+            if self.meta is None:
+                self.meta = {"inode": stat.st_ino, "head": "", "scanned": 0, "offsets": [], "times": []}
+        if len(self.meta["head"]) < HEAD_SIZE:
+            self.meta["head"] = self.read_head()
+        offsets = []
+        fields = []
+        with open_dat(self.path_to_file) as f:
+            position = self.meta["scanned"]
+            while position + PROBE_SIZE <= stat.st_size:
+                f.seek(position)
+                block = f.read(PROBE_SIZE)
+                # the line of an entry starts after the first newline (or at 0)
+                start = 0 if position == 0 else block.find(b"\n") + 1
+                lines = block[start:].split(b"\n")[:-1]
+                for line in lines:
+                    if is_data_line(line):
+                        offsets.append(position + start)
+                        fields.append(line.split(b"\t", 1)[0].decode())
+                        break
+                    start += len(line) + 1
+                position += STRIDE
+        if fields:
+            times = parse_timestamps(np.array(fields)).as_unit("ns").asi8
+            self.meta["offsets"] += offsets
+            self.meta["times"] += times.tolist()
+        if position != self.meta["scanned"]:
+            self.meta["scanned"] = position
+            self.save()
+
+    def lines(self, f, start, stop=None):
+        # the lines of f that can hold rows from start to stop (datetime64,
+        # None for no end), f is open_dat of the file, complete lines only
+        times = np.array(self.meta["times"], dtype=np.int64).view("datetime64[ns]")
+        offsets = self.meta["offsets"]
+        i = np.searchsorted(times, np.datetime64(start, "ns"), "left") - 1
+        j = len(times) if stop is None else np.searchsorted(times, np.datetime64(stop, "ns"), "right")
+        first = offsets[i] if i >= 0 else 0
+        f.seek(first)
+        if j < len(times):
+            data = f.read(offsets[j] - first)
+        else:
+            data = f.read()
+            data = data[:data.rfind(b"\n") + 1]
+        # the strides around the range are left out before parsing: timestamps start with
+        # "YYYY-MM-DD HH:MM:SS", lines outside those seconds are outside the range
+        low = seconds_text(start)
+        high = b"\xff" if stop is None else seconds_text(stop)
+        return [line for line in data.split(b"\n")
+                if low <= line[:SECONDS].replace(b"T", b" ") <= high and is_data_line(line)]
+
+
+def seconds_text(time):
+    return np.datetime_as_string(np.datetime64(time, "s")).replace("T", " ").encode()
+
+
+def read_time_range(path_to_file, start, stop=None, columns=None):
+    # the rows of a .dat file from start to stop, as read_n_last_lines gives the last rows
+    index = TimeIndex(path_to_file)
+    index.update()
+    with open_dat(path_to_file) as f:
+        lines = index.lines(f, start, stop)
+    return select_span(lines_to_dataframe([line.decode() for line in lines], columns), start, stop)
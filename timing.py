@@ -0,0 +1,111 @@
+import logging
+import logging.handlers
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+
+
+LOG_FILE = "timing.log"
+LOG_SIZE = 1000000
+LOG_BACKUPS = 3
+PROFILE_FILE = "refresh.prof"
+
+# order and short names for the readout
+STAGES = {"io": "io", "parse": "parse", "convert": "conv", "derive": "der", "pyramid": "pyr", "draw": "draw"}
+
+
+def run_text(stages, counts):
+    text = " ".join(f"{short} {1e3*stages[name]:.1f}" for name, short in STAGES.items() if name in stages) + " ms"
+    return ", ".join([text] + [f"{value} {name}" for name, value in counts.items()])
+
+
+class StageTimer():
+    """
+    This class remembers how long the last run of every
+    stage of a refresh (reading the file, parsing, R to T
+    conversion, drawing) took and how many rows and points
+    were handled. Every thread times its own run: the
+    ingestion threads one source at a time, which they
+    publish under the name of the source when it is done,
+    the Tk main loop the drawing. The readout has a line
+    per source and one for the drawing. Optionally every
+    refresh is written to a rotating log file.
+    """
+    def __init__(self):
+        self.local = threading.local()
+        self.runs = {}  # source name -> last published run
+        self.lock = threading.Lock()
+        self.logger = None
+
+    def run(self):
+        # stages and counts of the run of the calling thread
+        if not hasattr(self.local, "run"):
+            self.local.run = ({}, {})
+        return self.local.run
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        # a stage can run several times per refresh (e.g. parse in reload and update)
+        stages = self.run()[0]
+        stages[name] = stages.get(name, 0) + seconds
+
+    def start(self, *names):
+        # a new run of the calling thread, published runs are left as they are
+        self.local.run = ({name: 0 for name in names}, {})
+
+    def count(self, name, value):
+        self.run()[1][name] = value
+
+    def publish(self, key):
+        with self.lock:
+            self.runs[key] = self.run()
+
+    def discard(self, key):
+        with self.lock:
+            self.runs.pop(key, None)
+
+    def summary(self):
+        with self.lock:
+            runs = list(self.runs.items())
+        lines = [f"{key}: {run_text(*run)}" for key, run in runs]
+        return "\n".join(lines + [run_text(*self.run())])
+
+    def enable_log(self, path=LOG_FILE):
+        if self.logger is None:
+            self.logger = logging.getLogger("plot_temperature_wim.timing")
+            self.logger.setLevel(logging.INFO)
+            self.logger.propagate = False
+            handler = logging.handlers.RotatingFileHandler(path, maxBytes=LOG_SIZE, backupCount=LOG_BACKUPS)
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            self.logger.addHandler(handler)
+
+    def disable_log(self):
+        if self.logger is not None:
+            for handler in list(self.logger.handlers):
+                self.logger.removeHandler(handler)
+                handler.close()
+            self.logger = None
+
+    def log(self):
+        if self.logger is not None:
+            self.logger.info(self.summary().replace("\n", " | "))
+
+
+def save_profile(profiles, path=PROFILE_FILE):
+    # one refresh runs in two threads, so the profiles of both are combined
+    stats = pstats.Stats(profiles[0])
+    for profile in profiles[1:]:
+        stats.add(profile)
+    stats.dump_stats(path)
+    stats.sort_stats("cumulative").print_stats(25)
+
+
+timer = StageTimer()
@@ -0,0 +1,162 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+
+
+MIN_INTERVAL = 0.5   # s between two refreshes of the same file
+STAT_INTERVAL = 0.25  # s between stat checks without inotify
+SAFETY_INTERVAL = 5  # s between stat checks with inotify, for network shares
+
+# from <sys/inotify.h>
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT = struct.Struct("iIII")
+
+
+def load_inotify():
+    # returns the inotify file descriptor and libc, or None where inotify is missing
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    return fd, libc
+
+
+def file_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+class FileWatcher(threading.Thread):
+    """
+    This class calls callback(name) from its own thread
+    when a watched .dat file changes (other size, mtime or
+    inode). On Linux the directories of the files are
+    watched with inotify, so the thread sleeps until
+    something is written, elsewhere (or when inotify is not
+    available) the files are compared with os.stat every
+    STAT_INTERVAL. Bursts of writes are coalesced: a file
+    is refreshed at most once per min_interval, a change
+    within that time is picked up at the end of it.
+    """
+    def __init__(self, callback, min_interval=MIN_INTERVAL, use_inotify=True):
+        super().__init__(daemon=True)
+        self.callback = callback
+        self.min_interval = min_interval
+        self.lock = threading.Lock()
+        self.paths = {}
+        self.signatures = {}
+        self.last_call = {}
+        self.due = {}
+        self.directories = {}
+        self.inotify = load_inotify() if use_inotify else None
+        self.wake_read, self.wake_write = os.pipe()
+        self.running = True
+
+    def watch(self, name, path):
+        path = os.path.abspath(path)
+        with self.lock:
+            self.paths[name] = path
+            self.signatures[name] = file_signature(path)
+            directory = os.path.dirname(path)
+            if self.inotify is not None and directory not in self.directories.values():
+                fd, libc = self.inotify
+                wd = libc.inotify_add_watch(fd, directory.encode(), WATCH_MASK)
+                if wd >= 0:
+                    self.directories[wd] = directory
+        self.wake()
+
+    def unwatch(self, name):
+        with self.lock:
+            self.paths.pop(name, None)
+            self.due.pop(name, None)
+
+    def set_interval(self, min_interval):
+        self.min_interval = min_interval
+        self.wake()
+
+    def stop(self):
+        self.running = False
+        self.wake()
+
+    def wake(self):
+        os.write(self.wake_write, b"\0")
+
+    def run(self):
+        fds = [self.wake_read]
+        if self.inotify is not None:
+            fds.append(self.inotify[0])
+        check_all = time.monotonic()
+        while self.running:
+            now = time.monotonic()
+            with self.lock:
+                deadlines = list(self.due.values())
+            deadlines.append(check_all)
+            readable, _, _ = select.select(fds, [], [], max(min(deadlines) - now, 0))
+            changed = set()
+            if self.wake_read in readable:
+                os.read(self.wake_read, 4096)
+            if self.inotify is not None and self.inotify[0] in readable:
+                changed = self.read_events()
+            now = time.monotonic()
+            if now >= check_all:
+                with self.lock:
+                    changed = set(self.paths)
+                check_all = now + (STAT_INTERVAL if self.inotify is None else SAFETY_INTERVAL)
+            self.check(changed, now)
+            self.call_due(now)
+        os.close(self.wake_read)
+        os.close(self.wake_write)
+        if self.inotify is not None:
+            os.close(self.inotify[0])
+
+    def read_events(self):
+        # names of the watched files that an event was reported for
+        try:
+            data = os.read(self.inotify[0], 65536)
+        except BlockingIOError:
+            return set()
+        files = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT.unpack_from(data, offset)
+            filename = data[offset + EVENT.size:offset + EVENT.size + length].rstrip(b"\0")
+            offset += EVENT.size + length
+            if wd in self.directories:
+                files.add(os.path.join(self.directories[wd], os.fsdecode(filename)))
+        with self.lock:
+            return {name for name, path in self.paths.items() if path in files}
+
+    def check(self, names, now):
+        # only a real change schedules a refresh, not earlier than min_interval after the last one
+        with self.lock:
+            for name in names:
+                if name not in self.paths:
+                    continue
+                signature = file_signature(self.paths[name])
+                if signature != self.signatures.get(name):
+                    self.signatures[name] = signature
+                    if name not in self.due:
+                        self.due[name] = max(now, self.last_call.get(name, -float("inf")) + self.min_interval)
+
+    def call_due(self, now):
+        with self.lock:
+            names = [name for name, due in self.due.items() if due <= now]
+            for name in names:
+                del self.due[name]
+                self.last_call[name] = now
+        for name in names:
+            self.callback(name)